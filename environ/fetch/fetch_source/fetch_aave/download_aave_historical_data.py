@@ -6,7 +6,6 @@ Note: Dune account and password need to be filled
 
 from os import path
 import pandas as pd
-from tqdm import tqdm
 from duneanalytics import DuneAnalytics
 from environ.utils.config_parser import Config
 
@@ -62,13 +61,8 @@ def fetch_aave_historical_data() -> None:
     # data source: https://dune.com/queries/575705/1082614 (all asset)
     result_dict = download_dune_data(575705)
 
-    # Initialize the dataframe for storing the result from dictionary
-    df_result = pd.DataFrame()
-
-    # read the result dict row by row
-    for index in tqdm(range(len(result_dict))):
-        new_entity = pd.DataFrame(result_dict[index]["data"], index=[index])
-        df_result = pd.concat([df_result, new_entity], ignore_index=True, axis=0)
+    # build the dataframe from all rows of the result dict at once
+    df_result = pd.DataFrame([row["data"] for row in result_dict])
 
     # reorder the column
     # df_result = df_result[["day", "symbol", "deposit", "borrow"]]
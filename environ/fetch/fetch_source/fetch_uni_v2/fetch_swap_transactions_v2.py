@@ -4,11 +4,15 @@
 Fetch swap transactions of Uniswap V2
 """
 
-from os import path
-from time import sleep
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from os import path, remove, replace
+from typing import Iterator
 import warnings
-import pandas as pd
-from numpy import random
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
 
 import environ.fetch.fetch_utils.subgraph_query as subgraph
 from environ.utils.config_parser import Config
@@ -16,152 +20,261 @@ from environ.utils.info_logger import print_info_log
 
 warnings.filterwarnings("ignore")
 
+# number of windows the time range is split into, and how many of them are
+# fetched concurrently, which also bounds the swaps held in memory
+N_WINDOWS = 64
+N_WORKERS = 8
 
-def query_swaps_trading_v2(start_timestamp: int, end_timestamp: int) -> pd.DataFrame:
-    """
-    Get information of swaps transactions
-    """
+# Query 1000 swaps after the given timestamp, order by created timestamp
+SWAPS_QUERY = """
+query ($timestamp_gt: Int!){
+  swaps(first: 1000, orderBy: timestamp, orderDirection: asc, where: {timestamp_gt: $timestamp_gt })
+  {
+    id
+    transaction{
+      id
+    }
+    timestamp
+    pair{
+      id
+    }
 
-    # Initialize configuration
-    config = Config()
+    amount0In
+    amount0Out
+    amount1In
+    amount1Out
+    amountUSD
+    sender
+    to
+  }
+}
+"""
 
-    # Start from fetching 1000 swaps as the initial Batch 0, order by created timestamp
-    start_gt = start_timestamp - 1
-    params_start_gt = {"start_timestamp_gt": start_gt}
-    get_swaps_query_0 = """
-    query ($start_timestamp_gt: Int!){
-      swaps(first: 1000, orderBy: timestamp, orderDirection: asc, where: {timestamp_gt: $start_timestamp_gt }) 
-    { 
+# Query the tokens of up to 1000 pairs, which do not change between swaps
+PAIRS_QUERY = """
+query ($pair_ids: [ID!]!){
+  pairs(first: 1000, where: {id_in: $pair_ids})
+  {
+    id
+    token0 {
       id
-      transaction{
-        id
-      }
-      timestamp
-      pair{
-        id
-        token0 {
-          id
-          symbol
-        }
-        token1 {
-          id
-          symbol
-        }
-      }
-
-      amount0In
-      amount0Out
-      amount1In
-      amount1Out
-      amountUSD
-      sender
-      to
+      symbol
+    }
+    token1 {
+      id
+      symbol
     }
   }
-  """
+}
+"""
 
-    get_swaps_batch0 = subgraph.run_query_var(
-        config["dev"]["config"]["subgraph"]["HTTP_V2"],
-        get_swaps_query_0,
-        params_start_gt,
-    )
+# attributes of the swaps and the pairs as returned by the subgraph
+ID_STRUCT = pa.struct([("id", pa.string())])
+TOKEN_STRUCT = pa.struct([("id", pa.string()), ("symbol", pa.string())])
+RAW_SWAP_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("transaction", ID_STRUCT),
+        ("timestamp", pa.string()),
+        ("pair", ID_STRUCT),
+        ("amount0In", pa.string()),
+        ("amount0Out", pa.string()),
+        ("amount1In", pa.string()),
+        ("amount1Out", pa.string()),
+        ("amountUSD", pa.string()),
+        ("sender", pa.string()),
+        ("to", pa.string()),
+    ]
+)
+RAW_PAIR_SCHEMA = pa.schema(
+    [("id", pa.string()), ("token0", TOKEN_STRUCT), ("token1", TOKEN_STRUCT)]
+)
 
-    # Create a dataframe to store the basic structure of attributes,
-    # initializa with the first 1000 swaps
-    df_all_swaps = pd.DataFrame.from_dict(get_swaps_batch0["data"]["swaps"])
+# columns of the saved swaps and the flattened attributes they are taken from,
+# the swap attributes first and the pool attributes last
+SWAP_COLUMNS = {
+    "id": "id",
+    "transaction": "transaction.id",
+    "timestamp": "timestamp",
+    "amount0In": "amount0In",
+    "amount0Out": "amount0Out",
+    "amount1In": "amount1In",
+    "amount1Out": "amount1Out",
+    "amountUSD": "amountUSD",
+    "sender": "sender",
+    "to": "to",
+    "pool": "pair.id",
+    "token0_id": "token0.id",
+    "token0_symbol": "token0.symbol",
+    "token1_id": "token1.id",
+    "token1_symbol": "token1.symbol",
+}
+SWAP_SCHEMA = pa.schema(
+    [
+        (column, pa.int64() if column == "timestamp" else pa.string())
+        for column in SWAP_COLUMNS
+    ]
+)
 
-    # Do iteration to fetch all the swap tradings, skip the first 1000 in batch 0
-    # Start from the last timestamp which is got by batch 0
 
+def _query_swaps_window(window: tuple[int, int]) -> list[dict]:
+    """
+    Get the swaps transactions from the start of the window up to the page
+    that reaches its end, which still holds the swaps at or after the end
+    """
+
+    # Initialize configuration
+    config = Config()
+
+    start_timestamp, end_timestamp = window
+
+    # Start from the first swap not before the start timestamp
+    last_gt = start_timestamp - 1
+    swaps = []
     iter_count = 0
-    swaps_iter = get_swaps_batch0["data"][
-        "swaps"
-    ]  # Initialize entity for each batch (last fetched)
-    total_swaps_amount = len(
-        swaps_iter
-    )  # Initial the total swaps count with the count in batch 0
 
-    # Do loop until
+    # Do loop until the last fetched swap reaches the end of the window
+    while True:
+        # Query 1000 new swaps from the last timestamp, order by created timestamp
+        result_iter = subgraph.run_query_var(
+            config["dev"]["config"]["subgraph"]["HTTP_V2"],
+            SWAPS_QUERY,
+            {"timestamp_gt": last_gt},
+        )
+        if list(result_iter.keys()) != ["data"]:
+            continue
+
+        # List of swaps for this batch
+        swaps_iter = result_iter["data"]["swaps"]
+        swaps.extend(swaps_iter)
+
+        iter_count = iter_count + 1
+        print_info_log(
+            f"Batch {iter_count} of window {start_timestamp} fetched", "Uniswap V2"
+        )
+
+        if not swaps_iter or int(swaps_iter[-1]["timestamp"]) >= end_timestamp:
+            break
 
-    while int(swaps_iter[-1]["timestamp"]) < end_timestamp:
         # The last trading timestamp in the previous query batch
         last_gt = int(swaps_iter[-1]["timestamp"])
-        params_gt = {"timestamp_gt": last_gt}
-
-        # Query 1000 new pairs from the last timestamp
-        query_iter = """
-      query ($timestamp_gt: Int!){
-        swaps(first: 1000, orderBy: timestamp, orderDirection: asc, where: {timestamp_gt: $timestamp_gt }) 
-      { 
-        id
-        transaction{
-          id
-        }
-        timestamp
-        pair{
-          id
-          token0 {
-            id
-            symbol
-          }
-          token1 {
-            id
-            symbol
-          }
-        }
 
-        amount0In
-        amount0Out
-        amount1In
-        amount1Out
-        amountUSD
-        sender
-        to
-      }
-    }
+    return swaps
+
+
+def _query_pairs(pair_ids: list[str]) -> list[dict]:
+    """
+    Get the tokens of the pairs, querying 1000 pairs at a time
     """
-        result_iter = subgraph.run_query_var(
-            config["dev"]["config"]["subgraph"]["HTTP_V2"], query_iter, params_gt
-        )
-        if list(result_iter.keys()) == ["data"]:
-            # List of swaps for this batch
-            swaps_iter = result_iter["data"]["swaps"]
 
-            # Add list of this batch to the dataframe
-            df_all_swaps = df_all_swaps.append(swaps_iter, ignore_index=True)
+    # Initialize configuration
+    config = Config()
 
-            # Summary for this batch, and update iterator
-            iter_count = iter_count + 1
-            total_swaps_amount = total_swaps_amount + len(swaps_iter)
+    pairs = []
+    for i in range(0, len(pair_ids), 1000):
+        # retry the chunk until the subgraph returns data, as for the swaps
+        while True:
+            result = subgraph.run_query_var(
+                config["dev"]["config"]["subgraph"]["HTTP_V2"],
+                PAIRS_QUERY,
+                {"pair_ids": pair_ids[i : i + 1000]},
+            )
+            if list(result.keys()) == ["data"]:
+                break
 
-            print_info_log(f"Batch {iter_count} fetched", "Uniswap V2")
+        pairs.extend(result["data"]["pairs"])
 
-    df_all_swaps = df_all_swaps.drop(
-        df_all_swaps[df_all_swaps.timestamp >= str(end_timestamp)].index
-    )
+    return pairs
 
-    df_all_swaps["transaction"] = df_all_swaps["transaction"].apply(lambda x: x["id"])
-    df_all_swaps["pool"] = df_all_swaps["pair"].apply(lambda x: x["id"])
-    df_all_swaps["token0_id"] = df_all_swaps["pair"].apply(lambda x: x["token0"]["id"])
-    df_all_swaps["token0_symbol"] = df_all_swaps["pair"].apply(
-        lambda x: x["token0"]["symbol"]
-    )
-    df_all_swaps["token1_id"] = df_all_swaps["pair"].apply(lambda x: x["token1"]["id"])
-    df_all_swaps["token1_symbol"] = df_all_swaps["pair"].apply(
-        lambda x: x["token1"]["symbol"]
+
+def iter_swaps_trading_v2(
+    start_timestamp: int, end_timestamp: int
+) -> Iterator[pa.Table]:
+    """
+    Get information of swaps transactions, one table per window of the time range
+    in time order, holding the swaps of at most N_WORKERS + 1 windows at a time
+    """
+
+    # split the time range into windows which are fetched concurrently,
+    # as each batch mostly waits for the subgraph to respond
+    bounds = sorted(
+        {
+            start_timestamp + (end_timestamp - start_timestamp) * i // N_WINDOWS
+            for i in range(N_WINDOWS + 1)
+        }
     )
+    windows = iter(zip(bounds[:-1], bounds[1:]))
+
+    # tokens of the pairs fetched so far, keyed by the pair id
+    pair_tokens = {}
+
+    with ThreadPoolExecutor(max_workers=N_WORKERS) as executor:
+        # keep N_WORKERS windows in flight, submitting the next window only
+        # once the oldest one is taken, rather than all the windows at once
+        pending = deque(
+            (window[1], executor.submit(_query_swaps_window, window))
+            for window in islice(windows, N_WORKERS)
+        )
+
+        while pending:
+            window_end, future = pending.popleft()
+            swaps_window = future.result()
+            pending.extend(
+                (window[1], executor.submit(_query_swaps_window, window))
+                for window in islice(windows, 1)
+            )
+
+            # flatten the nested transaction and pair ids into columns at once,
+            # and drop the swaps of the last page beyond the end of the window
+            swaps = pa.Table.from_pylist(swaps_window, schema=RAW_SWAP_SCHEMA).flatten()
+            swaps = swaps.set_column(
+                swaps.schema.get_field_index("timestamp"),
+                "timestamp",
+                pc.cast(swaps["timestamp"], pa.int64()),
+            )
+            swaps = swaps.filter(pc.less(swaps["timestamp"], window_end))
+            if swaps.num_rows == 0:
+                continue
+
+            # add the tokens of the pairs, fetched once per distinct pair
+            pools = pc.unique(swaps["pair.id"]).to_pylist()
+            pair_tokens.update(
+                (pair["id"], pair)
+                for pair in _query_pairs(
+                    [pool for pool in pools if pool not in pair_tokens]
+                )
+            )
+            pairs = pa.Table.from_pylist(
+                [pair_tokens[pool] for pool in pools if pool in pair_tokens],
+                schema=RAW_PAIR_SCHEMA,
+            ).flatten()
+            tokens = pairs.take(
+                pc.index_in(swaps["pair.id"], value_set=pairs["id"])
+            ).drop_columns(["id"])
 
-    df_all_swaps = df_all_swaps.drop(["pair"], axis=1)
+            yield pa.Table.from_arrays(
+                swaps.columns + tokens.columns,
+                names=swaps.column_names + tokens.column_names,
+            ).select(list(SWAP_COLUMNS.values())).rename_columns(list(SWAP_COLUMNS))
+
+
+def query_swaps_trading_v2(start_timestamp: int, end_timestamp: int) -> pa.Table:
+    """
+    Get information of swaps transactions as an arrow table,
+    use .to_pandas() where a dataframe is needed
+    """
 
-    fetched_swaps_amount = total_swaps_amount - len(
-        df_all_swaps[df_all_swaps.timestamp >= str(end_timestamp)]
+    swaps = pa.concat_tables(
+        [SWAP_SCHEMA.empty_table()]
+        + list(iter_swaps_trading_v2(start_timestamp, end_timestamp))
     )
+
     print_info_log(
-        f"Amount of fetced swaps: {fetched_swaps_amount}",
+        f"Amount of fetced swaps: {swaps.num_rows}",
         "Uniswap V2",
     )
 
-    return df_all_swaps
+    return swaps
 
 
 def uniswap_v2_swaps(
@@ -178,7 +291,41 @@ def uniswap_v2_swaps(
         config["dev"]["config"]["data"]["UNISWAP_V2_DATA_PATH"],
         "swap/uniswap_v2_swaps_" + period_label + ".csv",
     )
-    df_all_swaps = query_swaps_trading_v2(start_timestamp, end_timestamp)
 
-    df_all_swaps.to_csv(file_name)
-    sleep(random.randint(10, 100) / 100)
+    # write the swaps of each window as soon as they are fetched, with an unnamed
+    # first column numbering the rows across the windows as a dataframe index would,
+    # into a temporary file that only replaces the final file once complete
+    tmp_file_name = file_name + ".tmp"
+    fetched_swaps_amount = 0
+    try:
+        with pv.CSVWriter(
+            tmp_file_name,
+            SWAP_SCHEMA.insert(0, pa.field("", pa.int64())),
+            write_options=pv.WriteOptions(quoting_style="needed"),
+        ) as writer:
+            for swaps in iter_swaps_trading_v2(start_timestamp, end_timestamp):
+                writer.write_table(
+                    swaps.add_column(
+                        0,
+                        pa.field("", pa.int64()),
+                        pa.array(
+                            range(
+                                fetched_swaps_amount,
+                                fetched_swaps_amount + swaps.num_rows,
+                            ),
+                            pa.int64(),
+                        ),
+                    )
+                )
+                fetched_swaps_amount += swaps.num_rows
+    except BaseException:
+        if path.exists(tmp_file_name):
+            remove(tmp_file_name)
+        raise
+
+    replace(tmp_file_name, file_name)
+
+    print_info_log(
+        f"Amount of fetced swaps: {fetched_swaps_amount}",
+        "Uniswap V2",
+    )
@@ -3,17 +3,24 @@ Query structure from the API.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 
 HTTP_V2 = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v2"
 HTTP_V3 = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
 
+# session shared by all the queries so that the connections to the subgraph
+# are kept alive between the pages instead of reconnecting for each request
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+
 
 def run_query(http: str, query_scripts: str) -> None:
     """
     execute query without variable parameters
     """
     # endpoint where you are making the request
-    request = requests.post(http, "", json={"query": query_scripts}, timeout=120)
+    request = SESSION.post(http, "", json={"query": query_scripts}, timeout=120)
     if request.status_code == 200:
         return request.json()
 
@@ -27,7 +34,7 @@ def run_query_var(http: str, query_scripts: str, var: dict[str, str]) -> None:
     execute query with variable paramters
     """
     # endpoint where you are making the request
-    request = requests.post(
+    request = SESSION.post(
         http, "", json={"query": query_scripts, "variables": var}, timeout=120
     )
     if request.status_code == 200:
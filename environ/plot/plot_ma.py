@@ -18,23 +18,26 @@ from environ.constants import (
     SAMPLE_PERIOD,
 )
 from environ.process.market.boom_bust import BOOM_BUST
+from environ.utils.data_loader import parse_file_dates
 from environ.utils.variable_constructer import ma_variable_columns, name_ma_variable
 
 
 def file_to_df(
     file_folder: str,
 ) -> pd.DataFrame:
-    frame = pd.DataFrame()
-    for filename in glob.glob(str(file_folder) + "/*.csv"):
-        date = filename.split("_")[-1].split(".")[0]
+    all_files = glob.glob(str(file_folder) + "/*.csv")
+
+    list_df = []
+    # parse the dates of all files at once rather than once per row after the concat
+    for filename, date in zip(all_files, parse_file_dates(all_files)):
         df_vol_tvl = pd.read_csv(
             filename,
             header=0,
             #   index_col=0
         )
         df_vol_tvl["Date"] = date
-        frame = pd.concat([frame, df_vol_tvl], ignore_index=True)
-    return frame
+        list_df.append(df_vol_tvl)
+    return pd.concat(list_df, ignore_index=True)
 
 
 def preprocess_ma(
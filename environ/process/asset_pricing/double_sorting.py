@@ -4,12 +4,12 @@ Functions to help with asset pricing
 
 import warnings
 
+import numpy as np
 import pandas as pd
 import scipy.stats as stats
 
 # import statsmodels.api as sm
 
-from environ.process.market.risk_free_rate import df_rf
 from environ.utils.variable_constructer import lag_variable_columns, name_lag_variable
 
 warnings.filterwarnings("ignore")
@@ -27,21 +27,23 @@ def calculate_period_return(
     Function to calculate the period return, where the period length is specified by freq
     """
 
-    df_panel["timestamp"] = df_panel[date_col].apply(lambda x: int(x.timestamp()))
-    df_panel.sort_values(by=["Token", "Date"], ascending=True, inplace=True)
+    df_panel = df_panel.sort_values(by=["Token", "Date"], ascending=True)
 
     # caculate rolling freq-day sum of supply rates for each token
-    df_panel["cum_supply_rates"] = (
-        df_panel.groupby("Token")[daily_supply_rate_col]
-        .rolling(freq)
-        .sum()
-        .reset_index(0)[daily_supply_rate_col]
-    )
+    # as the difference of per-token cumulative sums freq rows apart,
+    # which matches rolling(freq).sum() to floating-point rounding
+    token = df_panel["Token"]
+    cum_sum = df_panel[daily_supply_rate_col].fillna(0).groupby(token).cumsum()
+    cum_count = df_panel[daily_supply_rate_col].notna().groupby(token).cumsum()
+    window_sum = cum_sum - cum_sum.groupby(token).shift(freq, fill_value=0)
+    window_count = cum_count - cum_count.groupby(token).shift(freq, fill_value=0)
+
+    # only keep complete windows, consistent with rolling(freq).sum()
+    df_panel["cum_supply_rates"] = window_sum.where(window_count == freq)
 
-    df_panel = df_panel[
-        ((df_panel["timestamp"] - df_panel["timestamp"].min()) % (freq * 24 * 60 * 60))
-        == 0
-    ]
+    # keep the observations every freq days since the first date
+    timestamp = df_panel[date_col].to_numpy("datetime64[s]").astype("int64")
+    df_panel = df_panel[((timestamp - timestamp.min()) % (freq * 24 * 60 * 60)) == 0]
 
     # calculate simple dollar return
     df_panel["dollar_ret"] = df_panel.groupby("Token")[
@@ -58,90 +60,80 @@ def calculate_period_return(
     return df_panel
 
 
-def _sort_zero_value_port(
-    df_panel_period: pd.DataFrame, risk_factor: str
-) -> tuple[pd.DataFrame, pd.DataFrame]:
+def _sort_zero_value_port(df_panel: pd.DataFrame, lag_col: str) -> pd.Series:
     """
     Function to isolate zero-value dominance portfolio
     """
 
-    df_zero_dom = df_panel_period[
-        df_panel_period[name_lag_variable(risk_factor)] == 0
-    ].copy()
-    df_panel_period = df_panel_period[
-        df_panel_period[name_lag_variable(risk_factor)] != 0
-    ].copy()
+    is_zero_dom = df_panel[lag_col] == 0
+    n_zero_dom = is_zero_dom.groupby(df_panel["Date"]).transform("sum")
 
-    # if the length of df_zero_dom is 0, using the REFERENCE_DOM as a reference
-    if len(df_zero_dom) == 0:
-        n_treashold_zero = df_panel_period.loc[
-            df_panel_period[name_lag_variable(REFERENCE_DOM)] == 0
-        ].shape[0]
-        df_zero_dom = df_panel_period.iloc[:n_treashold_zero].copy()
-        df_panel_period = df_panel_period.iloc[n_treashold_zero:].copy()
-
-    df_zero_dom["portfolio"] = "P1"
+    # if a period has no zero-value token, using the REFERENCE_DOM as a reference
+    n_treashold_zero = (
+        (df_panel[name_lag_variable(REFERENCE_DOM)] == 0)
+        .groupby(df_panel["Date"])
+        .transform("sum")
+        .where(n_zero_dom == 0, 0)
+    )
+    rank = df_panel.groupby("Date").cumcount()
 
-    return df_panel_period, df_zero_dom
+    return is_zero_dom | (rank < n_treashold_zero)
 
 
 def _sorting(
-    df_panel_period: pd.DataFrame,
+    df_panel: pd.DataFrame,
     risk_factor: str,
     zero_value_portfolio: bool,
-    ret_dict: dict,
     brk_pt_lst: list[float],
-) -> dict:
+) -> pd.DataFrame:
     """
-    Function to implement the asset pricing for one period
+    Function to assign the tokens to portfolios in every period
     """
 
-    df_panel_period = df_panel_period.sort_values(
-        by=name_lag_variable(risk_factor), ascending=True
-    ).reset_index(drop=True)
+    lag_col = name_lag_variable(risk_factor)
+    df_panel = df_panel.sort_values(by=["Date", lag_col], ascending=True)
 
-    if zero_value_portfolio:
-        df_panel_period, df_zero_dom = _sort_zero_value_port(
-            df_panel_period=df_panel_period, risk_factor=risk_factor
-        )
-
-        ret_dict = _mcap_weight(
-            df_portfolio=df_zero_dom,
-            ret_dict=ret_dict,
-            port_idx=1,
-        )
+    is_zero_port = (
+        _sort_zero_value_port(df_panel=df_panel, lag_col=lag_col)
+        if zero_value_portfolio
+        else pd.Series(False, index=df_panel.index)
+    )
 
-    brk_pt_lst = [0] + brk_pt_lst + [1]
+    # rank of each token among the tokens to sort in the same period
+    is_sorted = ~is_zero_port
+    rank = is_sorted.groupby(df_panel["Date"]).cumsum().to_numpy() - 1
+    n_sorted = is_sorted.groupby(df_panel["Date"]).transform("sum").to_numpy()
 
     # portfolio construction
-    for port in range(len(brk_pt_lst) - 1):
-        df_portfolio_period = df_panel_period.iloc[
-            int(len(df_panel_period) * brk_pt_lst[port]) : int(
-                len(df_panel_period) * brk_pt_lst[port + 1]
-            )
-        ].copy()
+    brk_pt_idx = (n_sorted[:, None] * np.array(brk_pt_lst)).astype(int)
+    port_idx = (rank[:, None] >= brk_pt_idx).sum(axis=1)
+    port_idx += 2 if zero_value_portfolio else 1
+    port_idx[is_zero_port.to_numpy()] = 1
 
-        ret_dict = _mcap_weight(
-            df_portfolio=df_portfolio_period,
-            ret_dict=ret_dict,
-            port_idx=port + 2 if zero_value_portfolio else port + 1,
-        )
+    df_panel["portfolio"] = np.char.add("P", port_idx.astype(str))
 
-    return ret_dict
+    return df_panel
 
 
-def _mcap_weight(df_portfolio: pd.DataFrame, ret_dict: dict, port_idx: int) -> dict:
+def _mcap_weight(df_panel: pd.DataFrame, n_port: int) -> pd.DataFrame:
     """
-    Function to calculate the market cap weight
+    Function to calculate the market cap weighted return of each portfolio
     """
 
-    # calculate the market cap weight
-    df_portfolio["weight"] = df_portfolio["mcap"] / df_portfolio["mcap"].sum()
-    ret_dict[f"P{port_idx}"].append(
-        (df_portfolio["weight"] * df_portfolio["ret"]).sum()
+    # sum of market cap weighted return and market cap in one groupby pass
+    port_sum = (
+        df_panel.assign(mcap_ret=df_panel["mcap"] * df_panel["ret"])
+        .groupby(["Date", "portfolio"], sort=False)[["mcap_ret", "mcap"]]
+        .sum()
     )
 
-    return ret_dict
+    return (
+        (port_sum["mcap_ret"] / port_sum["mcap"])
+        .fillna(0)
+        .unstack(fill_value=0)
+        .reindex(columns=[f"P{port}" for port in range(1, n_port + 1)], fill_value=0)
+        .rename_axis(columns=None)
+    )
 
 
 def _eval_port(
@@ -153,80 +145,94 @@ def _eval_port(
     Function to evaluate the portfolio
     """
 
-    df_ret.sort_values(by="Date", ascending=True, inplace=True)
-    df_ret["Date"] = pd.to_datetime(df_ret["Date"])
-
     # annualize return
-    for portfolio in [f"P{port}" for port in range(1, n_port + 1)]:
-        df_ret[portfolio] = df_ret[portfolio] * 365.2425 / freq
+    port_lst = [f"P{port}" for port in range(1, n_port + 1)]
+    df_ret[port_lst] = df_ret[port_lst] * 365.2425 / freq
 
     # calculate the bottom minus top
     df_ret[f"P{n_port} - P1"] = df_ret[f"P{n_port}"] - df_ret["P1"]
 
-    portfolio_col = [f"P{port}" for port in range(1, n_port + 1)] + [f"P{n_port} - P1"]
+    portfolio_col = port_lst + [f"P{n_port} - P1"]
+    port_mean = df_ret[portfolio_col].mean()
+    port_std = df_ret[portfolio_col].std()
+    port_ttest = stats.ttest_1samp(df_ret[portfolio_col].to_numpy(), 0, axis=0)
 
     # a new dataframe to store the averag return for each portfolio
     df_ret_avg = pd.DataFrame(
         {
             "Portfolios": portfolio_col,
-            "Mean": df_ret[portfolio_col].mean().to_list(),
-            "t-stat of mean": df_ret[portfolio_col]
-            .apply(lambda x: stats.ttest_1samp(x, 0)[0])
-            .to_list(),
-            "p-value of mean": df_ret[portfolio_col]
-            .apply(lambda x: stats.ttest_1samp(x, 0)[1])
-            .to_list(),
-            "Stdev": df_ret[portfolio_col].std().to_list(),
-            "Sharpe": (
-                df_ret[portfolio_col].mean() / df_ret[portfolio_col].std()
-            ).to_list(),
+            "Mean": port_mean.to_list(),
+            "t-stat of mean": port_ttest.statistic.tolist(),
+            "p-value of mean": port_ttest.pvalue.tolist(),
+            "Stdev": port_std.to_list(),
+            "Sharpe": (port_mean / port_std).to_list(),
         }
     )
 
     return df_ret_avg
 
 
-def asset_pricing(
-    reg_panel: pd.DataFrame,
+def portfolio_pricing(
+    df_period: pd.DataFrame,
     brk_pt_lst: list[float],
     dominance_var: str = "volume_ultimate_share",
     freq: int = 14,
     zero_value_portfolio: bool = True,
 ) -> pd.DataFrame:
     """
-    Aggregate function to create portfolios
+    Function to create portfolios from the period return panel,
+    which can be reused across dominance variables of the same freq
     """
 
     n_port = len(brk_pt_lst) + 2 if zero_value_portfolio else len(brk_pt_lst) + 1
-    df_panel = calculate_period_return(df_panel=reg_panel, freq=freq)
 
-    # prepare the dataframe to store the portfolio
-    date_list = list(df_panel["Date"].unique())
-    date_list.remove(df_panel["Date"].min())
-
-    # dict to store the freq and portfolio return
-    ret_dict = {f"P{port}": [] for port in range(1, n_port + 1)}
-    ret_dict["Date"] = []
+    # keep only the columns used below so that the sorting and the groupby
+    # operate on one freshly consolidated block
+    hot_cols = list(
+        dict.fromkeys(["Token", "Date", "mcap", "ret", dominance_var, REFERENCE_DOM])
+    )
 
     df_panel = lag_variable_columns(
-        data=df_panel,
+        data=df_period[hot_cols],
         variable=[dominance_var, REFERENCE_DOM],
         time_variable="Date",
         entity_variable="Token",
     )
 
-    # loop through the date
-    for period in date_list:
-        # asset pricing
-        df_panel_period = df_panel[df_panel["Date"] == period].copy()
-        ret_dict = _sorting(
-            df_panel_period=df_panel_period,
-            risk_factor=dominance_var,
-            zero_value_portfolio=zero_value_portfolio,
-            ret_dict=ret_dict,
-            brk_pt_lst=brk_pt_lst,
-        )
-        ret_dict["Date"].append(period)
+    # asset pricing for all periods at once
+    df_panel = _sorting(
+        df_panel=df_panel,
+        risk_factor=dominance_var,
+        zero_value_portfolio=zero_value_portfolio,
+        brk_pt_lst=brk_pt_lst,
+    )
+
+    # portfolio return of each period except the first one
+    df_ret = (
+        _mcap_weight(df_panel=df_panel, n_port=n_port)
+        .drop(index=df_panel["Date"].min())
+        .reset_index()
+    )
 
     # evaluate the performance of the portfolio
-    return _eval_port(pd.DataFrame(ret_dict), freq, n_port)
+    return _eval_port(df_ret, freq, n_port)
+
+
+def asset_pricing(
+    reg_panel: pd.DataFrame,
+    brk_pt_lst: list[float],
+    dominance_var: str = "volume_ultimate_share",
+    freq: int = 14,
+    zero_value_portfolio: bool = True,
+) -> pd.DataFrame:
+    """
+    Aggregate function to create portfolios
+    """
+
+    return portfolio_pricing(
+        df_period=calculate_period_return(df_panel=reg_panel, freq=freq),
+        brk_pt_lst=brk_pt_lst,
+        dominance_var=dominance_var,
+        freq=freq,
+        zero_value_portfolio=zero_value_portfolio,
+    )
@@ -67,15 +67,17 @@ def indicator_generator(
     # load the data
     file_name_lst = _load_in_data_lst(file_root, filter_name=filter_name)
 
-    # lists to store the average clustering coefficient
-    date_lst = []
-    avg_cluster_lst = []
+    # preallocated arrays to store the average clustering coefficient
+    n_file = len(file_name_lst)
+    date_arr = np.empty(n_file, dtype=object)
+    avg_cluster_arr = np.full(n_file, np.nan)
+    is_valid = np.zeros(n_file, dtype=bool)
 
     # avg_cluster_df = pd.DataFrame(columns=["Date", "avg_cluster"])
 
     # loop through the data
-    for file_name in tqdm(
-        file_name_lst, desc="Generating average clustering coefficient"
+    for idx, file_name in enumerate(
+        tqdm(file_name_lst, desc="Generating average clustering coefficient")
     ):
         # get the date
         date = file_name.split("_")[-1].split(".")[0]
@@ -104,13 +106,14 @@ def indicator_generator(
         # compute the average clustering coefficient
         avg_cluster = _compute_avg_cluster(edge, weight)
 
-        # append to the list
-        date_lst.append(date)
-        avg_cluster_lst.append(avg_cluster)
+        # write to the arrays
+        date_arr[idx] = date
+        avg_cluster_arr[idx] = avg_cluster
+        is_valid[idx] = True
 
-    # create a dataframe
+    # create a dataframe from the dates with a non-empty network
     avg_cluster_df = pd.DataFrame(
-        data={"Date": date_lst, "avg_cluster": avg_cluster_lst}
+        data={"Date": date_arr[is_valid], "avg_cluster": avg_cluster_arr[is_valid]}
     )
 
     # convert the date column to datetime
@@ -91,9 +91,8 @@ def prepare_volume(date: datetime.datetime, data_srouce: str) -> None:
     )
 
     # Calculate and save the volume_in data
-    volume_in_data = edge_data.copy()
     volume_in_data = (
-        volume_in_data.groupby(["Target"])["Volume"]
+        edge_data.groupby(["Target"])["Volume"]
         .sum()
         .reset_index()
         .rename(columns={"Target": "Token"})
@@ -128,9 +127,8 @@ def prepare_volume(date: datetime.datetime, data_srouce: str) -> None:
     )
 
     # Calculate and save the volume_out data
-    volume_out_data = edge_data.copy()
     volume_out_data = (
-        volume_out_data.groupby(["Source"])["Volume"]
+        edge_data.groupby(["Source"])["Volume"]
         .sum()
         .reset_index()
         .rename(columns={"Source": "Token"})
@@ -121,14 +121,8 @@ if __name__ == "__main__":
             processed_data[f"total_{share}_usd"] / processed_data[f"total_{share}"]
         )
 
-    # get the unique dates
-    unique_dates = processed_data["Date"].unique()
-
-    # iterate through the dates
-    for date in unique_dates:
-        # get the data for the date
-        date_data = processed_data[processed_data["Date"] == date]
-
+    # iterate through the data of each date
+    for date, date_data in processed_data.groupby("Date"):
         # convert the date to %Y%m%d format
         date = date.strftime("%Y%m%d")
 
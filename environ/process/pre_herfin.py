@@ -10,6 +10,7 @@ from environ.process.market.cluster_coef import avg_cluster_df
 from environ.process.market.prepare_market_data import market_data
 from environ.process.market.trading_volume import df_volume
 from environ.tabulate.panel.panel_generator import _merge_boom_bust
+from environ.utils.data_loader import load_panel_main
 
 
 def construct_herfin(
@@ -50,9 +51,7 @@ def construct_herfin(
 
 if __name__ == "__main__":
     # read in the main panel
-    df_main = pd.read_pickle(
-        PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-    )
+    df_main = load_panel_main()
 
     # construct the herfin date series
     df_herfin = construct_herfin(main_panel=df_main)
@@ -4,6 +4,7 @@ Functions to prepare the main token-date panel.
 
 import numpy as np
 import pandas as pd
+import pyarrow.feather as feather
 from tqdm import tqdm
 
 from environ.constants import (
@@ -163,7 +164,16 @@ def construct_panel(merge_on: list[str]) -> pd.DataFrame:
 
 
 if __name__ == "__main__":
+    panel_main = construct_panel(merge_on=["Token", "Date"])
+
     # save the panel as a zip pickle
-    construct_panel(merge_on=["Token", "Date"]).to_pickle(
+    panel_main.to_pickle(
         PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
     )
+
+    # save the panel as an uncompressed feather for memory mapped loads
+    feather.write_feather(
+        panel_main,
+        PROCESSED_DATA_PATH / "panel_main.feather",
+        compression="uncompressed",
+    )
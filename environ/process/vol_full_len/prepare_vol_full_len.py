@@ -24,15 +24,15 @@ def _preprocess_volume(
 
     # prepare three data frame for ultimate source, ultimate target and intermediary
     # separately and with the volume
-    df_us = df_network[["ultimate_source", "volume_usd"]].copy()
-    df_ut = df_network[["ultimate_target", "volume_usd"]].copy()
+    df_us = df_network[["ultimate_source", "volume_usd"]]
+    df_ut = df_network[["ultimate_target", "volume_usd"]]
 
     # rename the columns
     df_us.columns = ["Token", "volume"]
     df_ut.columns = ["Token", "volume"]
 
     # drop all the intermediary that is empty
-    df_inter = df_network[df_network["intermediary"].map(lambda x: len(x) > 0)].copy()
+    df_inter = df_network[df_network["intermediary"].map(lambda x: len(x) > 0)]
 
     # iterate through the intermediary and create a new row for each
     # intermediary
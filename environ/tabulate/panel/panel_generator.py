@@ -10,11 +10,20 @@ Desc    : Generate the panel for regression.
 """
 
 import glob
+import hashlib
+import os
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+from environ.constants import CACHE_PATH
 from environ.process.market.boom_bust import BOOM_BUST
 from environ.utils.config_parser import Config
 from environ.utils.boom_calculator import is_boom
+from environ.utils.data_loader import load_dated_csvs, load_sp_index
 import matplotlib.dates as md
 
 # Initialize config
@@ -30,46 +39,150 @@ TOKEN_LIB_V2_STABLE = config["dev"]["config"]["token_library"]["v2"]["stable"]
 TOKEN_LIB_V3_TOKEN = config["dev"]["config"]["token_library"]["v3"]["token"]
 TOKEN_LIB_V3_STABLE = config["dev"]["config"]["token_library"]["v3"]["stable"]
 
+# directories and file patterns of the csv files with a date in the file name
+DATED_SOURCES = {
+    "volume_share": (rf"{NETWORK_DATA_PATH}/merged/volume_share", "*.csv"),
+    "volume_in_share": (rf"{NETWORK_DATA_PATH}/merged/volume_in_share", "*.csv"),
+    "volume_out_share": (rf"{NETWORK_DATA_PATH}/merged/volume_out_share", "*.csv"),
+    "tvl_share": (rf"{NETWORK_DATA_PATH}/merged/tvl_share", "*.csv"),
+    "inflow_centrality": (rf"{NETWORK_DATA_PATH}/merged/inflow_centrality", "*.csv"),
+    "outflow_centrality": (rf"{NETWORK_DATA_PATH}/merged/outflow_centrality", "*.csv"),
+    "betweenness_v2v3": (rf"{BETWEENNESS_DATA_PATH}/betweenness", "*_v2v3_*.csv"),
+}
+
+# root of the parquet datasets converted from the dated csv files
+DATED_DATASET_ROOT = rf"{NETWORK_DATA_PATH}/dated_dataset"
+
+# the last generated panel, pickled after the fingerprint of its source files
+PANEL_CACHE_PATH = CACHE_PATH / "panel" / "reg_panel.pkl"
+
+# the last generated panel in memory, keyed by the fingerprint of its source files
+_panel_memory_cache: dict[str, pd.DataFrame] = {}
+
+# known column types of the processed compound csv files
+COMPOUND_CSV_TYPES = {
+    "block_timestamp": "string",
+    "borrow_rate": "float64",
+    "supply_rates": "float64",
+    "total_supply_usd": "float64",
+    "total_borrow_usd": "float64",
+}
+
+
+def write_dated_dataset(name: str) -> None:
+    """
+    Convert the dated csv files of one source into a parquet dataset partitioned by year.
+    """
+
+    csv_dir, pattern = DATED_SOURCES[name]
+    frame = load_dated_csvs(glob.glob(rf"{csv_dir}/{pattern}"))
+
+    # drop the previous dataset so no stale year partitions are left behind
+    dataset_dir = rf"{DATED_DATASET_ROOT}/{name}"
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    ds.write_dataset(
+        pa.Table.from_pandas(
+            frame.assign(year=frame["Date"].dt.year), preserve_index=False
+        ),
+        dataset_dir,
+        format="parquet",
+        partitioning=["year"],
+        partitioning_flavor="hive",
+        existing_data_behavior="overwrite_or_ignore",
+    )
 
-def _merge_volume_share() -> pd.DataFrame:
+    # mark the dataset as newer than the csv directory it was converted from
+    os.utime(dataset_dir)
+
+
+def _load_dated_source(name: str) -> pd.DataFrame:
     """
-    Merge volume share data.
+    Load the dated files of one source, from the parquet dataset if it has been
+    written since any csv file was added, removed or rewritten, otherwise from
+    the csv files.
     """
-    reg_panel = []
 
-    # combine all csv files in data/data_network/merged/volume_share.
-    # each csv file's title contains the date, and has columes: Token, Volume, and has row number
-    # the new combined dataframe has colume: Date, Token, Volume
+    csv_dir, pattern = DATED_SOURCES[name]
+    dataset_dir = rf"{DATED_DATASET_ROOT}/{name}"
+    all_files = glob.glob(rf"{csv_dir}/{pattern}")
+
+    # the directory mtime covers added and removed files, the file mtimes
+    # cover files rewritten in place
+    csv_mtime = max(
+        [os.stat(csv_dir).st_mtime] + [os.stat(f).st_mtime for f in all_files]
+    )
 
-    # get all csv files in data/data_network/merged/volume_share
-    path = rf"{NETWORK_DATA_PATH}/merged/volume_share"  # use your path
-    all_files = glob.glob(path + "/*.csv")
+    if os.path.isdir(dataset_dir) and os.stat(dataset_dir).st_mtime >= csv_mtime:
+        return pd.read_parquet(dataset_dir).drop(columns=["year"])
 
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_vol_share = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_vol_share["Date"] = date
-        list_df.append(df_vol_share)
+    return load_dated_csvs(all_files)
+
+
+def _read_compound_csv(filename: str) -> pd.DataFrame:
+    """
+    Read one processed compound csv file and tag it with the token in the file name.
+    """
+
+    df_comp = pd.read_csv(
+        filename,
+        header=0,
+        usecols=list(COMPOUND_CSV_TYPES),
+        dtype=COMPOUND_CSV_TYPES,
+    )
+    token = filename.split("_")[-2]
+    df_comp["Token"] = "WETH" if token == "ETH" else token
+
+    return df_comp
+
+
+def _load_compound_csvs() -> pd.DataFrame:
+    """
+    Load the processed compound csv files into one dataframe with the token
+    name in the file name as the primary key, reading the files in threads.
+    The rate and share helpers all select their columns from this frame.
+    """
+
+    # skip the file with token name "WBTC2"
+    all_files = [
+        filename
+        for filename in glob.glob(rf"{COMPOUND_DATA_PATH}/*_processed.csv")
+        if filename.split("_")[-2] != "WBTC2"
+    ]
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list_df = list(executor.map(_read_compound_csv, all_files))
 
     # combine all csv files into one dataframe
-    reg_panel = pd.concat(list_df, axis=0, ignore_index=True)
+    frame = pd.concat(list_df, axis=0, ignore_index=True, copy=False)
 
-    # convert date to datetime
-    reg_panel["Date"] = pd.to_datetime(reg_panel["Date"], format="%Y%m%d")
+    # convert date in "YYYY-MM-DD" to datetime once for all helpers
+    frame["block_timestamp"] = pd.to_datetime(
+        frame["block_timestamp"], format="%Y-%m-%d", cache=True
+    )
+
+    # rename the column "block_timestamp" to "Date"
+    return frame.rename(columns={"block_timestamp": "Date"})
+
+
+def _merge_volume_share() -> pd.DataFrame:
+    """
+    Merge volume share data.
+    """
+    # combine all csv files in data/data_network/merged/volume_share.
+    # each csv file's title contains the date, and has columes: Token, Volume, and has row number
+    # the new combined dataframe has colume: Date, Token, Volume
 
-    # drop the column "Unnamed: 0"
-    reg_panel = reg_panel.drop(columns=["Unnamed: 0"])
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    reg_panel = _load_dated_source("volume_share")
 
     # rename the Volume column to Volume_share
     reg_panel = reg_panel.rename(columns={"Volume": "Volume_share"})
 
-    return reg_panel
+    return reg_panel.set_index(["Date", "Token"])
 
 
-def _merge_volume_in_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_volume_in_share() -> pd.DataFrame:
     """
     Merge volume in share data.
     """
@@ -78,40 +191,17 @@ def _merge_volume_in_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # each csv file's title contains the date, and has columes: Token, Volume, and has row number
     # the new combined dataframe has colume: Date, Token, Volume
 
-    # get all csv files in data/data_network/merged/volume_in_share
-    path = rf"{NETWORK_DATA_PATH}/merged/volume_in_share"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_vol_in_share = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_vol_in_share["Date"] = date
-        list_df.append(df_vol_in_share)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
-
-    # drop the column "Unnamed: 0"
-    frame = frame.drop(columns=["Unnamed: 0"])
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("volume_in_share")
 
     # rename the Volume column to volume_in_share
     frame = frame.rename(columns={"Volume": "volume_in_share"})
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(
-        reg_panel, frame, how="outer", on=["Date", "Token"], sort=False
-    )
-
-    return reg_panel
+    return frame.set_index(["Date", "Token"])
 
 
-def _merge_volume_out_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_volume_out_share() -> pd.DataFrame:
     """
     Merge volume out share data.
     """
@@ -120,259 +210,91 @@ def _merge_volume_out_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # each csv file's title contains the date, and has columes: Token, Volume, and has row number
     # the new combined dataframe has colume: Date, Token, Volume
 
-    # get all csv files in data/data_network/merged/volume_out_share
-    path = rf"{NETWORK_DATA_PATH}/merged/volume_out_share"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_vol_out_share = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_vol_out_share["Date"] = date
-        list_df.append(df_vol_out_share)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
-
-    # drop the column "Unnamed: 0"
-    frame = frame.drop(columns=["Unnamed: 0"])
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("volume_out_share")
 
     # rename the Volume column to volume_out_share
     frame = frame.rename(columns={"Volume": "volume_out_share"})
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(
-        reg_panel, frame, how="outer", on=["Date", "Token"], sort=False
-    )
-
-    return reg_panel
+    return frame.set_index(["Date", "Token"])
 
 
-def _merge_compound_rate(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_compound_rate(compound: pd.DataFrame) -> pd.DataFrame:
     """
     Merge compound rate data.
     """
 
-    path = rf"{COMPOUND_DATA_PATH}"  # use your path
-    all_files = glob.glob(path + "/*_processed.csv")
-
-    # merge all csv files into one dataframe with token name in the file name as the primary key
-    list_df = []
-    for filename in all_files:
-        df_comp_rate = pd.read_csv(filename, index_col=None, header=0)
-        token = filename.split("_")[-2]
-        # skip the file with token name "WBTC2"
-        if token == "WBTC2":
-            continue
-
-        if token == "ETH":
-            df_comp_rate["token"] = "WETH"
-        else:
-            df_comp_rate["token"] = token
-
-        list_df.append(df_comp_rate)
+    # only keep the columne "borrow_rate" and "supply_rates" and Date and token
+    return compound.set_index(["Date", "Token"])[["borrow_rate", "supply_rates"]]
 
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date in "YYYY-MM-DD" to datetime
-    frame["block_timestamp"] = pd.to_datetime(
-        frame["block_timestamp"], format="%Y-%m-%d"
-    )
-
-    # rename the column "block_timestamp" to "Date"
-    frame = frame.rename(columns={"block_timestamp": "Date"})
-    frame = frame.rename(columns={"token": "Token"})
-
-    # only keep the columne "borrow_rate" and "supply_rates" and block_timestamp and token
-    frame = frame[["Date", "Token", "borrow_rate", "supply_rates"]]
-
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
-
-    return reg_panel
 
-
-def _merge_compound_supply_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_compound_supply_share(compound: pd.DataFrame) -> pd.DataFrame:
     """
     Merge compound supply share data.
     """
 
-    # combine all csv files with "_processed" at the end
-    # of the name in data/data_compound into a panel dataset.
-    # each csv file's title contains the date, and has columes: Token, Borrow, and has row number
-    # the new combined dataframe has colume: Date, Token, Borrow
-    # get all csv files in data/data_compound
-    path = rf"{COMPOUND_DATA_PATH}"  # use your path
-    all_files = glob.glob(path + "/*_processed.csv")
-
-    # merge all csv files into one dataframe with token name in the file name as the primary key
-    list_df = []
-    for filename in all_files:
-        df_comp_share = pd.read_csv(filename, index_col=None, header=0)
-        token = filename.split("_")[-2]
-        # skip the file with token name "WBTC2"
-        if token == "WBTC2":
-            continue
-
-        if token == "ETH":
-            df_comp_share["token"] = "WETH"
-        else:
-            df_comp_share["token"] = token
-
-        list_df.append(df_comp_share)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
     # calculate the supply share of each token each day
-    frame["total_supply_usd"] = frame["total_supply_usd"].astype(float)
-    frame["total_supply"] = frame.groupby("block_timestamp")[
-        "total_supply_usd"
-    ].transform("sum")
-    frame["total_supply_usd"] = frame["total_supply_usd"] / frame["total_supply"]
-    frame = frame.drop(columns=["total_supply"])
-
-    # convert date in "YYYY-MM-DD" to datetime
-    frame["block_timestamp"] = pd.to_datetime(
-        frame["block_timestamp"], format="%Y-%m-%d"
+    total_supply = compound.groupby("Date", sort=False)["total_supply_usd"].sum()
+
+    # only keep columnes of "Date", "Token", "Supply_share"
+    frame = pd.DataFrame(
+        {
+            "Date": compound["Date"],
+            "Token": compound["Token"],
+            "Supply_share": compound["total_supply_usd"].to_numpy()
+            / compound["Date"].map(total_supply).to_numpy(),
+        }
     )
 
-    # rename the column "block_timestamp" to "Date"
-    frame = frame.rename(columns={"block_timestamp": "Date"})
-    frame = frame.rename(columns={"token": "Token"})
-    frame = frame.rename(columns={"total_supply_usd": "Supply_share"})
-
-    # only keep columnes of "Date", "Token", "Borrow_share"
-    frame = frame[["Date", "Token", "Supply_share"]]
-
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
-
-    return reg_panel
+    return frame.set_index(["Date", "Token"])
 
 
-def _merge_compound_borrow_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_compound_borrow_share(compound: pd.DataFrame) -> pd.DataFrame:
     """
     Merge compound borrow share data.
     """
 
-    # combine all csv files with "_processed" at the end
-    # of the name in data/data_compound into a panel dataset.
-    # each csv file's title contains the date, and has columes: Token, Borrow, and has row number
-    # the new combined dataframe has colume: Date, Token, Borrow
-    # get all csv files in data/data_compound
-    path = rf"{COMPOUND_DATA_PATH}"  # use your path
-    all_files = glob.glob(path + "/*_processed.csv")
-
-    # merge all csv files into one dataframe with token name in the file name as the primary key
-    list_df = []
-    for filename in all_files:
-        df_comp_share = pd.read_csv(filename, index_col=None, header=0)
-        token = filename.split("_")[-2]
-        # skip the file with token name "WBTC2"
-        if token == "WBTC2":
-            continue
-
-        if token == "ETH":
-            df_comp_share["token"] = "WETH"
-        else:
-            df_comp_share["token"] = token
-
-        list_df.append(df_comp_share)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # calculate the supply share of each token each day
-    frame["total_borrow_usd"] = frame["total_borrow_usd"].astype(float)
-    frame["total_borrow"] = frame.groupby("block_timestamp")[
-        "total_borrow_usd"
-    ].transform("sum")
-    frame["total_borrow_usd"] = frame["total_borrow_usd"] / frame["total_borrow"]
-    frame = frame.drop(columns=["total_borrow"])
-
-    # convert date in "YYYY-MM-DD" to datetime
-    frame["block_timestamp"] = pd.to_datetime(
-        frame["block_timestamp"], format="%Y-%m-%d"
-    )
-
-    # rename the column "block_timestamp" to "Date"
-    frame = frame.rename(columns={"block_timestamp": "Date"})
-    frame = frame.rename(columns={"token": "Token"})
-    frame = frame.rename(columns={"total_borrow_usd": "Borrow_share"})
+    # calculate the borrow share of each token each day
+    total_borrow = compound.groupby("Date", sort=False)["total_borrow_usd"].sum()
 
     # only keep columnes of "Date", "Token", "Borrow_share"
-    frame = frame[["Date", "Token", "Borrow_share"]]
+    frame = pd.DataFrame(
+        {
+            "Date": compound["Date"],
+            "Token": compound["Token"],
+            "Borrow_share": compound["total_borrow_usd"].to_numpy()
+            / compound["Date"].map(total_borrow).to_numpy(),
+        }
+    )
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
+    return frame.set_index(["Date", "Token"])
 
-    return reg_panel
 
-
-def _merge_tvl_share(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_tvl_share() -> pd.DataFrame:
     """
     Merge tvl share data.
     """
 
-    # get all csv files in data/data_network/merged/volume_share
-    path = rf"{NETWORK_DATA_PATH}/merged/tvl_share"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_tvl_share = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_tvl_share["Date"] = date
-        list_df.append(df_tvl_share)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date in "YYYYMMDD" to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("tvl_share")
 
     # rename the column "token" to "Token"
     frame = frame.rename(columns={"token": "Token"})
     frame = frame.rename(columns={"total_tvl": "TVL_share"})
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
+    return frame.set_index(["Date", "Token"])
 
-    return reg_panel
 
-
-def _merge_in_centrality(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_in_centrality() -> pd.DataFrame:
     """
     Merge inflow eigenvector centrality data.
     """
 
-    # get all csv files in data/data_network/merged/inflow_centrality
-    path = rf"{NETWORK_DATA_PATH}/merged/inflow_centrality"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_in_cent = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_in_cent["Date"] = date
-        list_df.append(df_in_cent)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date in "YYYYMMDD" to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("inflow_centrality")
 
     # rename the column "token" to "Token"
     frame = frame.rename(columns={"token": "Token"})
@@ -381,35 +303,17 @@ def _merge_in_centrality(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # only keep columnes of "Date", "Token", "Inflow_centrality"
     frame = frame[["Date", "Token", "Inflow_centrality"]]
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
-
-    return reg_panel
+    return frame.set_index(["Date", "Token"])
 
 
-def _merge_out_centrality(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _merge_out_centrality() -> pd.DataFrame:
     """
     Merge outflow eigenvector centrality data.
     """
 
-    # get all csv files in data/data_network/merged/outflow_centrality
-    path = rf"{NETWORK_DATA_PATH}/merged/outflow_centrality"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_out_cent = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_out_cent["Date"] = date
-        list_df.append(df_out_cent)
-
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
-
-    # convert date in "YYYYMMDD" to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("outflow_centrality")
 
     # rename the column "token" to "Token"
     frame = frame.rename(columns={"token": "Token"})
@@ -418,47 +322,79 @@ def _merge_out_centrality(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # only keep columnes of "Date", "Token", "Outflow_centrality"
     frame = frame[["Date", "Token", "Outflow_centrality"]]
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
+    return frame.set_index(["Date", "Token"])
 
-    # rename the column "token" to "Token"
-    reg_panel = reg_panel.rename(columns={"token": "Token"})
 
-    return reg_panel
+def _merge_betweenness() -> pd.DataFrame:
+    """
+    Merge betweenness centrality data.
+    """
+
+    # combine all csv files into one dataframe with the date from the file name,
+    # reading the parquet dataset instead once it has been written
+    frame = _load_dated_source("betweenness_v2v3")
+
+    # rename the column "node" to "Token"
+    frame = frame.rename(columns={"node": "Token"})
+
+    return frame.set_index(["Date", "Token"])
 
 
-def _merge_betweenness(reg_panel: pd.DataFrame) -> pd.DataFrame:
+def _share_token_categories(frames: list[pd.DataFrame]) -> list[pd.DataFrame]:
     """
-    Merge betweenness centrality data.
+    Convert the Token index level of the (Date, Token) indexed frames to one shared
+    categorical dtype so that aligning them hashes integer codes, not strings.
     """
 
-    # get all csv files in data/data_betweenness/betweenness
-    path = rf"{BETWEENNESS_DATA_PATH}/betweenness"  # use your path
-    all_files = glob.glob(path + "/*.csv")
+    token_dtype = pd.CategoricalDtype(
+        sorted(set().union(*(frame.index.unique("Token") for frame in frames)))
+    )
 
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        if filename.split("_")[-2].split(".")[0] == "v2v3":
-            df_between = pd.read_csv(filename, index_col=None, header=0)
-            date = filename.split("_")[-1].split(".")[0]
-            df_between["Date"] = date
-            list_df.append(df_between)
+    return [
+        frame.set_axis(
+            frame.index.set_levels(
+                frame.index.levels[1].astype(token_dtype), level="Token"
+            )
+        )
+        for frame in frames
+    ]
 
-    # combine all csv files into one dataframe
-    frame = pd.concat(list_df, axis=0, ignore_index=True)
 
-    # convert date in "YYYYMMDD" to datetime
-    frame["Date"] = pd.to_datetime(frame["Date"], format="%Y%m%d")
+def _outer_join_panels(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Outer join the (Date, Token) indexed frames, in a single concat when every
+    frame has unique keys. pd.concat fails on duplicated keys or pairs them up
+    by position, so otherwise the frames are merged one by one, which takes the
+    cross product of the duplicated keys as the keyed merges did.
+    """
 
-    # rename the column "node" to "Token"
-    frame = frame.rename(columns={"node": "Token"})
+    if all(frame.index.is_unique for frame in frames):
+        return pd.concat(frames, axis=1, join="outer", copy=False)
 
-    # merge the two dataframe into one panel dataset via outer join
-    reg_panel = pd.merge(reg_panel, frame, how="outer", on=["Date", "Token"])
+    panel = frames[0]
+    for frame in frames[1:]:
+        panel = panel.merge(frame, how="outer", left_index=True, right_index=True)
 
-    return reg_panel
+    return panel
+
+
+def _stack_token_columns(wide: pd.DataFrame, value_name: str) -> pd.DataFrame:
+    """
+    Reshape a Date-indexed frame with one column per token into a long
+    Date, Token, value_name frame, dropping missing values as stack() does.
+    """
+
+    n_date, n_token = wide.shape
+    values = wide.to_numpy().ravel()
+    is_valid = ~np.isnan(values)
+
+    return pd.DataFrame(
+        {
+            "Date": np.repeat(wide.index.to_numpy(), n_token)[is_valid],
+            "Token": np.tile(wide.columns.to_numpy(), n_date)[is_valid],
+            value_name: values[is_valid],
+        }
+    )
 
 
 def _merge_prc_gas(reg_panel: pd.DataFrame) -> pd.DataFrame:
@@ -469,7 +405,7 @@ def _merge_prc_gas(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # read in the csv file
     prc = pd.read_csv(
         rf"{GLOBAL_DATA_PATH}/token_market/primary_token_price_2.csv",
-        index_col=None,
+        index_col=0,
         header=0,
     )
 
@@ -484,10 +420,9 @@ def _merge_prc_gas(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # the dataframe has row number
     # the dataframe is sorted by Date
 
-    # save the column name into a list except for the Date and unnamed column
+    # save the column name into a list except for the Date column
     col = list(prc.columns)
     col.remove("Date")
-    col.remove("Unnamed: 0")
 
     # read in the csv file
     gas = pd.read_csv(
@@ -506,123 +441,70 @@ def _merge_prc_gas(reg_panel: pd.DataFrame) -> pd.DataFrame:
     gas = gas[["Date", "Gas_fee", "ETH_price"]]
 
     # merge the prc and gas dataframe into one panel dataset via outer join on "Date"
-    prc = pd.merge(prc, gas, how="outer", on=["Date"])
+    prc = pd.merge(prc, gas, how="outer", on=["Date"], sort=False)
 
     # load in the data in data/data_global/token_market/PerformanceGraphExport.xls
     # the dataframe has colume: Date, Token, Price
     # the dataframe has row number
     # the dataframe is sorted by Date and Token
 
-    # read in the csv file and ignore the first six rows
-    idx = pd.read_excel(
-        rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls",
-        index_col=None,
-        skiprows=6,
-        skipfooter=4,
-        usecols="A:B",
-    )
+    # read in the date and S&P columns, cached as parquet after the first read
+    idx = load_sp_index(rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls")
 
     # convert Effective date to datetime
     idx["Date"] = pd.to_datetime(idx["Date"])
 
     # merge the prc and idx dataframe into one panel dataset via outer join on "Date"
-    prc = pd.merge(prc, idx, how="outer", on=["Date"])
+    prc = pd.merge(prc, idx, how="outer", on=["Date"], sort=False)
 
     # imputation for S&P via forward fill
     prc = prc.sort_values(by=["Date"], ascending=True)
     prc["S&P"] = prc["S&P"].interpolate()
 
-    # drop the unnecessary column "Unnamed: 0"
-    prc = prc.drop(columns=["Unnamed: 0"])
-
     # save the prc to test folder
     prc.to_csv(rf"test/prc.csv", index=False)
 
     # calculate the log prcurn of price for each token (column)
     # and save them in new columns _log_prcurn
     # reminder: np.log(0) = -inf
-    ret = prc.set_index("Date").copy()
-    ret = ret.apply(lambda x: (np.log(x) - np.log(x.shift(1))))
-
-    # # reset the index of ret
-    # ret = ret.reset_index()
-
-    # copy the ret as a new dataframe named cov
-    cov_gas = ret.copy()
-    cov_eth = ret.copy()
-    cov_sp = ret.copy()
-    std = ret.copy()
-
-    # # set the Date column as index
-    # ret = ret.set_index("Date")
-    # std = std.set_index("Date")
-
-    # sort the dataframe by ascending Date for cov_gas, cov_eth and cov_sp
-    ret = ret.sort_values(by="Date", ascending=True)
-    cov_gas = cov_gas.sort_values(by="Date", ascending=True)
-    cov_eth = cov_eth.sort_values(by="Date", ascending=True)
-    cov_sp = cov_sp.sort_values(by="Date", ascending=True)
-    std = std.sort_values(by="Date", ascending=True)
+    ret = np.log(prc.set_index("Date")).diff()
 
     # calcuate the covariance between past 30 days log
-    # return of each column in col and that of Gas_fee
-    for i in col:
-        cov_gas[i] = cov_gas[i].rolling(30).corr(cov_gas["Gas_fee"])
+    # return of all columns in col and that of Gas_fee at once
+    cov_gas = ret[col].rolling(30).corr(ret["Gas_fee"])
 
     # calcuate the covariance between past 30 days log
-    # return of each column in col and that of ETH_price
-    for i in col:
-        cov_eth[i] = cov_eth[i].rolling(30).corr(cov_eth["ETH_price"])
+    # return of all columns in col and that of ETH_price at once
+    cov_eth = ret[col].rolling(30).corr(ret["ETH_price"])
 
     # caculate the covariance between past 30 days log
-    # return of each column in col and that of S&P
-    for i in col:
-        cov_sp[i] = cov_sp[i].rolling(30).corr(cov_sp["S&P"])
+    # return of all columns in col and that of S&P at once
+    cov_sp = ret[col].rolling(30).corr(ret["S&P"])
 
-    # calculate the standard deviation of each column in col
-    for i in col:
-        std[i] = std[i].rolling(30).std()
+    # calculate the standard deviation of all columns in col at once
+    std = ret[col].rolling(30).std()
 
-    # drop the Gas_fee and ETH_price and S&P500 columns for ret and cov
-    ret = ret.drop(columns=["Gas_fee", "ETH_price", "S&P"])
-    cov_gas = cov_gas.drop(columns=["Gas_fee", "ETH_price", "S&P"])
-    cov_eth = cov_eth.drop(columns=["Gas_fee", "ETH_price", "S&P"])
-    cov_sp = cov_sp.drop(columns=["Gas_fee", "ETH_price", "S&P"])
-    std = std.drop(columns=["Gas_fee", "ETH_price", "S&P"])
+    # only keep the token columns for ret
+    ret = ret[col]
     gas = gas.drop(columns=["ETH_price"])
 
-    # ret and cov to panel dataset, column: Date, Token, log return and covariance
-    ret = ret.stack().reset_index()
-    cov_gas = cov_gas.stack().reset_index()
-    cov_eth = cov_eth.stack().reset_index()
-    cov_sp = cov_sp.stack().reset_index()
-    std = std.stack().reset_index()
-
-    # rename the column "level_1" to "Token"
-    ret = ret.rename(columns={"level_1": "Token"})
-    cov_gas = cov_gas.rename(columns={"level_1": "Token"})
-    cov_eth = cov_eth.rename(columns={"level_1": "Token"})
-    cov_sp = cov_sp.rename(columns={"level_1": "Token"})
-    std = std.rename(columns={"level_1": "Token"})
-
-    # rename the column "0" to "log_return" and "0" to "covariance"
-    ret = ret.rename(columns={0: "log_return"})
-    cov_gas = cov_gas.rename(columns={0: "corr_gas"})
-    cov_eth = cov_eth.rename(columns={0: "corr_eth"})
-    cov_sp = cov_sp.rename(columns={0: "corr_sp"})
-    std = std.rename(columns={0: "std"})
-
-    # merge the ret, cov_gas, cov_eth, cov_sp dataframe into
-    # one panel dataset via outer join on "Date" and "Token
-    reg_panel = pd.merge(reg_panel, ret, how="outer", on=["Date", "Token"])
-    reg_panel = pd.merge(reg_panel, cov_gas, how="outer", on=["Date", "Token"])
-    reg_panel = pd.merge(reg_panel, cov_eth, how="outer", on=["Date", "Token"])
-    reg_panel = pd.merge(reg_panel, cov_sp, how="outer", on=["Date", "Token"])
-    reg_panel = pd.merge(reg_panel, std, how="outer", on=["Date", "Token"])
-    reg_panel = pd.merge(reg_panel, gas, how="outer", on=["Date"])
+    # ret, cov and std to one panel dataset indexed by Date and Token
+    prc_panel = _outer_join_panels(
+        [
+            _stack_token_columns(ret, "log_return").set_index(["Date", "Token"]),
+            _stack_token_columns(cov_gas, "corr_gas").set_index(["Date", "Token"]),
+            _stack_token_columns(cov_eth, "corr_eth").set_index(["Date", "Token"]),
+            _stack_token_columns(cov_sp, "corr_sp").set_index(["Date", "Token"]),
+            _stack_token_columns(std, "std").set_index(["Date", "Token"]),
+        ]
+    )
 
-    # drop the unnecessary column "Unnamed: 0"
-    reg_panel = reg_panel.drop(columns=["Unnamed: 0"])
+    # join the ret, cov_gas, cov_eth, cov_sp and std into
+    # the panel dataset via outer join on "Date" and "Token"
+    reg_panel = _outer_join_panels(
+        [reg_panel.set_index(["Date", "Token"]), prc_panel]
+    ).reset_index()
+    reg_panel = pd.merge(reg_panel, gas, how="outer", on=["Date"], sort=False)
 
     return reg_panel
 
@@ -678,7 +560,7 @@ def _merge_exceedance(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # read in the csv file
     prc = pd.read_csv(
         rf"{GLOBAL_DATA_PATH}/token_market/primary_token_price_2.csv",
-        index_col=None,
+        index_col=0,
         header=0,
     )
 
@@ -693,38 +575,27 @@ def _merge_exceedance(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # the dataframe has row number
     # the dataframe is sorted by Date
 
-    # save the column name into a list except for the Date and unnamed column
+    # save the column name into a list except for the Date column
     col = list(prc.columns)
     col.remove("Date")
-    col.remove("Unnamed: 0")
-
-    # read in the csv file and ignore the first six rows
-    idx = pd.read_excel(
-        rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls",
-        index_col=None,
-        skiprows=6,
-        skipfooter=4,
-        usecols="A:B",
-    )
+
+    # read in the date and S&P columns, cached as parquet after the first read
+    idx = load_sp_index(rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls")
 
     # convert Effective date to datetime
     idx["Date"] = pd.to_datetime(idx["Date"])
 
     # merge the prc and idx dataframe into one panel dataset via outer join on "Date"
-    prc = pd.merge(prc, idx, how="outer", on=["Date"])
+    prc = pd.merge(prc, idx, how="outer", on=["Date"], sort=False)
 
     # imputation for S&P via forward fill
     prc = prc.sort_values(by=["Date"], ascending=True)
     prc["S&P"] = prc["S&P"].interpolate()
 
-    # drop the unnecessary column "Unnamed: 0"
-    prc = prc.drop(columns=["Unnamed: 0"])
-
     # calculate the log prcurn of price for each token (column)
     # and save them in new columns _log_prcurn
     # reminder: np.log(0) = -inf
-    ret = prc.set_index("Date").copy()
-    ret = ret.apply(lambda x: (np.log(x) - np.log(x.shift(1))))
+    ret = np.log(prc.set_index("Date")).diff()
 
     # reset the index
     ret = ret.reset_index()
@@ -770,17 +641,11 @@ def _merge_exceedance(reg_panel: pd.DataFrame) -> pd.DataFrame:
     ret = ret.drop(columns=["S&P", "exceedance"])
 
     # ret and cov to panel dataset, column: Date, Token, log return and covariance
-    ret = ret.stack().reset_index()
-
-    # rename the column "level_1" to "Token"
-    ret = ret.rename(columns={"level_1": "Token"})
-
-    # rename the column "0" to "log_return" and "0" to "covariance"
-    ret = ret.rename(columns={0: "exceedance"})
+    ret = _stack_token_columns(ret, "exceedance")
 
     # merge the ret, cov_gas, cov_eth, cov_sp dataframe into
     # one panel dataset via outer join on "Date" and "Token
-    reg_panel = pd.merge(reg_panel, ret, how="outer", on=["Date", "Token"])
+    reg_panel = pd.merge(reg_panel, ret, how="outer", on=["Date", "Token"], sort=False)
 
     return reg_panel
 
@@ -820,6 +685,7 @@ def _merge_gas_volatility(reg_panel: pd.DataFrame) -> pd.DataFrame:
         gas,
         how="outer",
         on=["Date"],
+        sort=False,
     )
 
     return reg_panel
@@ -844,6 +710,7 @@ def _merge_stableshare(reg_panel: pd.DataFrame) -> pd.DataFrame:
         stable,
         how="outer",
         on=["Date", "Token"],
+        sort=False,
     )
 
     return reg_panel
@@ -876,28 +743,107 @@ def _merge_boom_bust(
     return reg_panel
 
 
+def _source_fingerprint() -> str:
+    """
+    Fingerprint the source files of the panel by their paths and modification times.
+    """
+
+    # skip the parquet files, which are caches written while the panel is built
+    source_files = sorted(
+        filename
+        for filename in glob.glob(rf"{NETWORK_DATA_PATH}/merged/*/*.csv")
+        + glob.glob(rf"{COMPOUND_DATA_PATH}/*_processed.csv")
+        + glob.glob(rf"{BETWEENNESS_DATA_PATH}/betweenness/*.csv")
+        + glob.glob(rf"{GLOBAL_DATA_PATH}/token_market/*")
+        + glob.glob(rf"{GLOBAL_DATA_PATH}/gas_fee/*")
+        + glob.glob(rf"{GLOBAL_DATA_PATH}/stablecoin/*")
+        if not filename.endswith(".parquet")
+    )
+
+    return hashlib.blake2b(
+        repr(
+            [(filename, os.stat(filename).st_mtime_ns) for filename in source_files]
+        ).encode()
+    ).hexdigest()[:16]
+
+
 def generate_panel() -> pd.DataFrame:
     """
-    generate the panel dataset
+    generate the panel dataset, reusing the cached panel
+    as long as the source files are unchanged
+    """
+
+    source_fingerprint = _source_fingerprint()
+
+    if source_fingerprint not in _panel_memory_cache:
+        _panel_memory_cache.clear()
+        _panel_memory_cache[source_fingerprint] = _load_or_generate_panel(
+            source_fingerprint
+        )
+
+    # the callers modify the panel, so each gets its own copy
+    return _panel_memory_cache[source_fingerprint].copy()
+
+
+def _load_or_generate_panel(source_fingerprint: str) -> pd.DataFrame:
+    """
+    Load the cached panel if it was generated from the same source files,
+    otherwise generate the panel and replace the cached one with it.
     """
 
+    # the fingerprint is read first so that a stale panel is never unpickled
+    if PANEL_CACHE_PATH.exists():
+        with open(PANEL_CACHE_PATH, "rb") as f:
+            if pickle.load(f) == source_fingerprint:
+                return pickle.load(f)
+
+    reg_panel = _generate_panel()
+
+    PANEL_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(PANEL_CACHE_PATH, "wb") as f:
+        pickle.dump(source_fingerprint, f)
+        pickle.dump(reg_panel, f)
+
+    return reg_panel
+
+
+def _generate_panel() -> pd.DataFrame:
+    """
+    generate the panel dataset from the source files
+    """
+
+    # read the compound csv files once for the rate and share helpers
+    compound = _load_compound_csvs()
+
     # Merge the panel dataset with the volume, share, centrality and betweenness
-    reg_panel = _merge_volume_share()
-    reg_panel = _merge_volume_in_share(reg_panel)
-    reg_panel = _merge_volume_out_share(reg_panel)
-    reg_panel = _merge_compound_rate(reg_panel)
-    reg_panel = _merge_compound_supply_share(reg_panel)
-    reg_panel = _merge_compound_borrow_share(reg_panel)
-    reg_panel = _merge_tvl_share(reg_panel)
-    reg_panel = _merge_in_centrality(reg_panel)
-    reg_panel = _merge_out_centrality(reg_panel)
-    reg_panel = _merge_betweenness(reg_panel)
+    # in an outer join aligned on the (Date, Token) index
+    reg_panel = _outer_join_panels(
+        _share_token_categories(
+            [
+                _merge_volume_share(),
+                _merge_volume_in_share(),
+                _merge_volume_out_share(),
+                _merge_compound_rate(compound),
+                _merge_compound_supply_share(compound),
+                _merge_compound_borrow_share(compound),
+                _merge_tvl_share(),
+                _merge_in_centrality(),
+                _merge_out_centrality(),
+                _merge_betweenness(),
+            ]
+        )
+    ).reset_index()
     reg_panel = _merge_prc_gas(reg_panel)
     reg_panel = _merge_nonstable(reg_panel)
     reg_panel = _merge_isweth(reg_panel)
     # reg_panel = _merge_exceedance(reg_panel)
     reg_panel = _merge_gas_volatility(reg_panel)
     reg_panel = _merge_stableshare(reg_panel)
+
+    # the outer merges above skip their key sort, so sort the panel once here
+    reg_panel = reg_panel.sort_values(
+        by=["Date", "Token"], kind="stable", ignore_index=True
+    )
     reg_panel = _merge_avg_eigenvec(reg_panel)
     reg_panel = _merge_boom_bust(reg_panel)
 
@@ -5,8 +5,8 @@ Functions to construct value stores proxies for Panel.
 import warnings
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
 from environ.utils.config_parser import Config
+from environ.utils.data_loader import load_sp_index
 from environ.utils.info_logger import print_info_log
 
 # ignore the warnings
@@ -46,14 +46,8 @@ def _beta(reg_panel: pd.DataFrame) -> pd.DataFrame:
     col.remove("Unnamed: 0")
 
     # load in the data in data/data_global/token_market/PerformanceGraphExport.xls
-    # read in the csv file and ignore the first six rows
-    idx = pd.read_excel(
-        rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls",
-        index_col=None,
-        skiprows=6,
-        skipfooter=4,
-        usecols="A:B",
-    )
+    # read in the date and S&P columns, cached as parquet after the first read
+    idx = load_sp_index(rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls")
 
     # convert Effective date to datetime
     idx["Date"] = pd.to_datetime(idx["Date"])
@@ -104,8 +98,7 @@ def _beta(reg_panel: pd.DataFrame) -> pd.DataFrame:
     ret = pd.merge(ret, rf_df, how="left", on=["Date"])
 
     # subtract the risk free rate from the return
-    for i in col:
-        ret[i] = ret[i] - ret["RF"]
+    ret[col] = ret[col].sub(ret["RF"], axis=0)
 
     # subtract the risk free rate from the S&P return
     ret["S&P"] = ret["S&P"] - ret["RF"]
@@ -113,20 +106,15 @@ def _beta(reg_panel: pd.DataFrame) -> pd.DataFrame:
     # sort the dataframe by date
     ret = ret.sort_values(by=["Date"], ascending=True)
 
-    for i in col:
-        rolling_cov = ret[i].rolling(30).cov(ret["S&P"])
-        rolling_var = ret["S&P"].rolling(30).var()
-        rolling_beta = rolling_cov / rolling_var
-        ret[f"{i}_beta"] = rolling_beta
+    # calculate the rolling beta of all tokens in one block
+    rolling_var = ret["S&P"].rolling(30).var()
+    ret[col] = ret[col].rolling(30).cov(ret["S&P"]).div(rolling_var, axis=0)
 
     # set the date as index
     ret = ret.set_index("Date")
 
-    # drop the columns in col and "S&P" and "RF"
-    ret = ret.drop(columns=col + ["S&P", "RF"])
-
-    # rename the columns to the original token name
-    ret = ret.rename(columns={f"{col_name}_beta": col_name for col_name in col})
+    # drop the columns "S&P" and "RF"
+    ret = ret.drop(columns=["S&P", "RF"])
 
     # convert the dataframe to panel dataset
     ret = ret.stack().reset_index()
@@ -191,8 +179,7 @@ def _sentiment(reg_panel: pd.DataFrame) -> pd.DataFrame:
     ret = ret.apply(lambda x: (np.log(x) - np.log(x.shift(1))))
 
     # caculate the covariance between past 30 days
-    for col_name in col:
-        ret[col_name] = ret[col_name].rolling(30).corr(ret["sentiment"])
+    ret[col] = ret[col].rolling(30).corr(ret["sentiment"])
 
     # drop the column "sentiment"
     cov_stm = ret.drop(columns=["sentiment"])
@@ -250,8 +237,7 @@ def _rolling_average_return(reg_panel: pd.DataFrame) -> pd.DataFrame:
     ret = ret.replace([np.inf, -np.inf], np.nan)
 
     # get the 30-day rolling average return of each token
-    for col_name in tqdm(col):
-        ret[col_name] = ret[col_name].rolling(30).mean()
+    ret[col] = ret[col].rolling(30).mean()
 
     # drop Unnamed: 0 column
     ret = ret.drop(columns=["Unnamed: 0"])
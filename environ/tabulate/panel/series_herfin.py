@@ -2,11 +2,14 @@
 Script to generate the dataframe related to the herfindahl index.
 """
 
+import os
+
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import glob
-from tqdm import tqdm
 from environ.constants import (
+    CACHE_PATH,
     NETWORK_DATA_PATH,
     BETWEENNESS_DATA_PATH,
     GLOBAL_DATA_PATH,
@@ -14,269 +17,184 @@ from environ.constants import (
     DATA_PATH,
     FIGURE_PATH,
 )
+from environ.utils.data_loader import (
+    DATED_CSV_TYPES,
+    load_sp_index,
+    parse_file_dates,
+    read_csvs,
+)
 
 
 # Initialize data path
 START_DATE = SAMPLE_PERIOD[0]
 END_DATE = SAMPLE_PERIOD[1]
 
-
-def _merge_herfindahl_liquidity(herfindahl: pd.DataFrame) -> pd.DataFrame:
+# directory, file pattern, herfindahl column names and whether to normalize
+# the columns to shares first, keyed by the name of the cached sums
+HERFINDAHL_SOURCES = {
+    "volume_share": (
+        rf"{NETWORK_DATA_PATH}/merged/volume_share",
+        "*.csv",
+        {"Volume": "herfindahl_volume"},
+        False,
+    ),
+    "inflow_centrality": (
+        rf"{NETWORK_DATA_PATH}/merged/inflow_centrality",
+        "*.csv",
+        {"eigenvector_centrality": "herfindahl_inflow_centrality"},
+        True,
+    ),
+    "outflow_centrality": (
+        rf"{NETWORK_DATA_PATH}/merged/outflow_centrality",
+        "*.csv",
+        {"eigenvector_centrality": "herfindahl_outflow_centrality"},
+        True,
+    ),
+    "betweenness_v2v3": (
+        rf"{BETWEENNESS_DATA_PATH}/betweenness",
+        "*_v2v3_*.csv",
+        {
+            "betweenness_centrality_count": "herfindahl_betweenness_centrality_count",
+            "betweenness_centrality_volume": "herfindahl_betweenness_centrality_volume",
+        },
+        False,
+    ),
+    "tvl_share": (
+        rf"{NETWORK_DATA_PATH}/merged/tvl_share",
+        "*.csv",
+        {"total_tvl": "herfindahl_tvl"},
+        False,
+    ),
+}
+
+
+def _herfindahl_sums(
+    all_files: list[str], cols: list[str], normalize: bool = False
+) -> pd.DataFrame:
     """
-    Function to merge the herfindahl index.
+    Function to calculate the herfindahl index of the columns in each csv file,
+    with one row per file, its name and its date, and 0 for a file without rows.
     """
 
-    # merge the herfindahl index for liquidity
-    # get all csv files in data/data_network/merged/liquidity_share
-    path = NETWORK_DATA_PATH / "merged" / "tvl_share"  # use your path
-    all_files = glob.glob(str(path) + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_in_cent = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_in_cent["total_tvl"] = df_in_cent["total_tvl"].astype(float)
-        # convert the "yyyymmdd" date to datetime format
-        date = pd.to_datetime(date, format="%Y%m%d")
-        list_df.append((date, (df_in_cent["total_tvl"] ** 2).sum()))
-
-    list_df = pd.DataFrame(list_df, columns=["Date", "total_tvl"])
-
-    # sort the dataframe by date
-    list_df = list_df.sort_values(by="Date", ascending=True)
-
-    # rename the column "total_tvl" to "herfindahl_inflow_centrality"
-    list_df = list_df.rename(columns={"total_tvl": "herfindahl_tvl"})
-
-    # merge the herfindahl index for inflow eigenvector centrality using outer join
-    herfindahl = pd.merge(
-        herfindahl,
-        list_df,
-        how="outer",
-        on=["Date"],
+    # parse the columns of all csv files at once and number the rows by file
+    tables = read_csvs(all_files, column_types=DATED_CSV_TYPES, columns=cols)
+    n_rows = [table.num_rows for table in tables]
+    file_id = np.repeat(np.arange(len(all_files)), n_rows)
+    values = np.column_stack(
+        [
+            np.concatenate(
+                [np.empty(0)]
+                + [table[col].to_numpy(zero_copy_only=False) for table in tables]
+            ).astype(float)
+            for col in cols
+        ]
+    ).reshape(len(file_id), len(cols))
+
+    def sum_by_file(array: np.ndarray) -> np.ndarray:
+        """Sum each column over the rows of each file, skipping nan."""
+        array = np.where(np.isnan(array), 0, array)
+        return np.column_stack(
+            [
+                np.bincount(file_id, weights=column, minlength=len(all_files))
+                for column in array.T
+            ]
+        ).reshape(len(all_files), len(cols))
+
+    # normalize the columns to shares of each file before squaring
+    if normalize:
+        values = values / sum_by_file(values)[file_id]
+
+    # sum of squares of each file in one pass over the array
+    sums = sum_by_file(values * values)
+
+    return pd.DataFrame(
+        {
+            "filename": all_files,
+            "Date": parse_file_dates(all_files),
+            **dict(zip(cols, sums.T)),
+        }
     )
 
-    return herfindahl
-
-
-def _merge_herfindahl_volume() -> pd.DataFrame:
-    """
-    Function to merge the herfindahl index.
-    """
-
-    # merge the herfindahl index for volume
-    # get all csv files in data/data_network/merged/volume_share
-    path = rf"{NETWORK_DATA_PATH}/merged/volume_share"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # calculate the herfindahl index
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_volume = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_volume["Volume"] = df_volume["Volume"].astype(float)
-        # convert the "yyyymmdd" date to datetime format
-        date = pd.to_datetime(date, format="%Y%m%d")
-        list_df.append((date, (df_volume["Volume"] ** 2).sum()))
-
-    # calculate the herfindahl index that's all
-    herfindahl = pd.DataFrame(list_df, columns=["Date", "herfindahl_volume"])
-
-    # sort the dataframe by date
-    herfindahl = herfindahl.sort_values(by="Date", ascending=True)
-
-    return herfindahl
-
 
-def _merge_herfindahl_inflow_centrality(herfindahl: pd.DataFrame) -> pd.DataFrame:
+def _herfindahl_series(
+    all_files: list[str], cols: list[str], cache_name: str, normalize: bool = False
+) -> pd.DataFrame:
     """
-    Function to merge the herfindahl index for inflow eigenvector centrality.
+    Function to calculate the herfindahl index of the columns in each csv file,
+    reusing the cached sums of the files unchanged since the last run.
     """
 
-    # merge the herfindahl index for inflow eigenvector centrality
-    # get all csv files in data/data_network/merged/inflow_centrality
-    path = rf"{NETWORK_DATA_PATH}/merged/inflow_centrality"  # use your path
-    all_files = glob.glob(path + "/*.csv")
+    cache_path = CACHE_PATH / "herfindahl" / f"{cache_name}.parquet"
+    mtimes = {filename: os.stat(filename).st_mtime_ns for filename in all_files}
 
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_in_cent = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_in_cent["eigenvector_centrality"] = df_in_cent[
-            "eigenvector_centrality"
-        ].astype(float)
-
-        # normalized the eigenvector centrality
-        df_in_cent["eigenvector_centrality"] = (
-            df_in_cent["eigenvector_centrality"]
-            / df_in_cent["eigenvector_centrality"].sum()
-        )
+    # keep the cached sums of the files that still exist with the same mtime
+    if cache_path.exists():
+        cached = pd.read_parquet(cache_path)
+        cached = cached[cached["filename"].map(mtimes) == cached["mtime"]]
+    else:
+        cached = pd.DataFrame(columns=["filename", "mtime", "Date"] + cols)
 
-        # convert the "yyyymmdd" date to datetime format
-        date = pd.to_datetime(date, format="%Y%m%d")
-        list_df.append((date, (df_in_cent["eigenvector_centrality"] ** 2).sum()))
+    # only parse the new or modified files
+    cached_files = set(cached["filename"])
+    new_files = [filename for filename in all_files if filename not in cached_files]
 
-    list_df = pd.DataFrame(list_df, columns=["Date", "eigenvector_centrality"])
+    if new_files:
+        sums = _herfindahl_sums(new_files, cols, normalize)
+        sums.insert(1, "mtime", sums["filename"].map(mtimes))
 
-    # sort the dataframe by date
-    list_df = list_df.sort_values(by="Date", ascending=True)
-
-    # rename the column "eigenvector_centrality" to "herfindahl_inflow_centrality"
-    list_df = list_df.rename(
-        columns={"eigenvector_centrality": "herfindahl_inflow_centrality"}
-    )
-
-    # merge the herfindahl index for inflow eigenvector centrality using outer join
-    herfindahl = pd.merge(
-        herfindahl,
-        list_df,
-        how="outer",
-        on=["Date"],
-    )
+        cached = sums if cached.empty else pd.concat([cached, sums], ignore_index=True)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cached.to_parquet(cache_path, index=False, compression="zstd")
 
-    return herfindahl
+    return cached.drop(columns=["filename", "mtime"]).reset_index(drop=True)
 
 
-def _merge_herfindahl_outflow_centrality(herfindahl: pd.DataFrame) -> pd.DataFrame:
+def _merge_herfindahl(name: str) -> pd.DataFrame:
     """
-    Function to merge the herfindahl index for outflow eigenvector centrality.
+    Function to merge the herfindahl index of one source in HERFINDAHL_SOURCES.
     """
 
-    # merge the herfindahl index for outflow eigenvector centrality
-    # get all csv files in data/data_network/merged/outflow_centrality
-    path = rf"{NETWORK_DATA_PATH}/merged/outflow_centrality"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        df_out_cent = pd.read_csv(filename, index_col=None, header=0)
-        date = filename.split("_")[-1].split(".")[0]
-        df_out_cent["eigenvector_centrality"] = df_out_cent[
-            "eigenvector_centrality"
-        ].astype(float)
-
-        # normalzed the eigenvector centrality
-        df_out_cent["eigenvector_centrality"] = (
-            df_out_cent["eigenvector_centrality"]
-            / df_out_cent["eigenvector_centrality"].sum()
-        )
-
-        # convert the "yyyymmdd" date to datetime format
-        date = pd.to_datetime(date, format="%Y%m%d")
-        list_df.append((date, (df_out_cent["eigenvector_centrality"] ** 2).sum()))
+    path, pattern, columns, normalize = HERFINDAHL_SOURCES[name]
+    all_files = glob.glob(rf"{path}/{pattern}")
 
-    list_df = pd.DataFrame(list_df, columns=["Date", "eigenvector_centrality"])
+    # calculate the herfindahl index of each csv file with the date from the file name
+    herfindahl = _herfindahl_series(all_files, list(columns), name, normalize)
 
     # sort the dataframe by date
-    list_df = list_df.sort_values(by="Date", ascending=True)
-
-    # rename the column "eigenvector_centrality" to "herfindahl_outflow_centrality"
-    list_df = list_df.rename(
-        columns={"eigenvector_centrality": "herfindahl_outflow_centrality"}
-    )
-
-    # merge the herfindahl index for outflow eigenvector centrality using outer join
-    herfindahl = pd.merge(
-        herfindahl,
-        list_df,
-        how="outer",
-        on=["Date"],
-    )
+    herfindahl = herfindahl.sort_values(by="Date", ascending=True)
 
-    return herfindahl
+    return herfindahl.rename(columns=columns).set_index("Date")
 
 
-def _merge_herfindahl_betweenness_centrality(herfindahl: pd.DataFrame) -> pd.DataFrame:
-    """
-    Function to merge the herfindahl index for betweenness centrality.
-    """
-
-    # get all csv files in data/data_betweenness/betweenness
-    path = rf"{BETWEENNESS_DATA_PATH}/betweenness"  # use your path
-    all_files = glob.glob(path + "/*.csv")
-
-    # extract date from file name
-    # combine data from all csv files into one dataframe, dropping row number of each csv file
-    list_df = []
-    for filename in all_files:
-        if filename.split("_")[-2].split(".")[0] == "v2v3":
-            df_between = pd.read_csv(filename, index_col=None, header=0)
-            date = filename.split("_")[-1].split(".")[0]
-            date = pd.to_datetime(date, format="%Y%m%d")
-            list_df.append(
-                (
-                    date,
-                    (df_between["betweenness_centrality_count"] ** 2).sum(),
-                    (df_between["betweenness_centrality_volume"] ** 2).sum(),
-                )
-            )
-
-    list_df = pd.DataFrame(
-        list_df,
-        columns=[
-            "Date",
-            "betweenness_centrality_count",
-            "betweenness_centrality_volume",
-        ],
-    )
-
-    # sort the dataframe by date
-    list_df = list_df.sort_values(by="Date", ascending=True)
-
-    # rename the columns "betweenness_centrality_count" and "betweenness_centrality_volume" to
-    # "herfindahl_betweenness_centrality_count" and "herfindahl_betweenness_centrality_volume"
-    list_df = list_df.rename(
-        columns={
-            "betweenness_centrality_count": "herfindahl_betweenness_centrality_count",
-            "betweenness_centrality_volume": "herfindahl_betweenness_centrality_volume",
-        }
-    )
-
-    # merge the herfindahl index for betweenness centrality using outer join
-    herfindahl = pd.merge(
-        herfindahl,
-        list_df,
-        how="outer",
-        on=["Date"],
-    )
-
-    return herfindahl
-
-
-def _merge_total_market_trading_volume(herfindahl: pd.DataFrame) -> pd.DataFrame:
+def _merge_total_market_trading_volume() -> pd.DataFrame:
     """
     Function to merge the total market trading volume.
     """
 
-    # create a dataframe with column Date from START_DATE to END_DATE
-    # and a column named "total_market_trading_volume" with value 0
     date_range = pd.date_range(START_DATE, END_DATE)
-    df_total = pd.DataFrame(date_range, columns=["Date"])
-    df_total["total_volumes"] = 0
 
     # load in the data in data/data_global/coingecko/token_data
-    # sum the total_volumnes of the token to the df
     path = rf"{GLOBAL_DATA_PATH}/coingecko/token_data"  # use your path
     all_files = glob.glob(path + "/*.csv")
-    for filename in tqdm(all_files):
-        # expand the date range to START_DATE to END_DATE
-        df_temp = pd.read_csv(filename, index_col=None, header=0)
-        df_temp["time"] = pd.to_datetime(df_temp["time"], format="%Y-%m-%d")
-        # rename the column "time" to "Date"
-        df_temp = df_temp.rename(columns={"time": "Date"})
-        df_temp = df_temp.set_index("Date")
-        df_temp = df_temp.reindex(date_range, fill_value=0)
-        df_temp = df_temp.reset_index()
-        df_temp = df_temp.rename(columns={"index": "Date"})
-        df_total["total_volumes"] = df_total["total_volumes"] + df_temp["total_volumes"]
+    df_token = pa.concat_tables(
+        read_csvs(
+            all_files,
+            column_types={"time": pa.string(), "total_volumes": pa.float64()},
+            columns=["time", "total_volumes"],
+        )
+    ).to_pandas()
+    df_token["time"] = pd.to_datetime(df_token["time"], format="%Y-%m-%d")
+
+    # sum the total_volumnes of the tokens on each date from START_DATE to END_DATE,
+    # where a missing volume of any token makes the total of that date missing
+    is_missing = df_token["total_volumes"].isna().groupby(df_token["time"]).any()
+    total_volumes = df_token.groupby("time")["total_volumes"].sum().mask(is_missing)
+    df_total = (
+        total_volumes.reindex(date_range, fill_value=0)
+        .rename_axis("Date")
+        .reset_index()
+    )
+
     # # plot the total market trading volume
     # plt.plot(df_total["Date"], df_total["total_volumes"])
     # plt.xlabel("Date")
@@ -299,15 +217,29 @@ def _merge_total_market_trading_volume(herfindahl: pd.DataFrame) -> pd.DataFrame
         index=False,
     )
 
-    # merge the total market trading volume using outer join
-    herfindahl = pd.merge(
-        herfindahl,
-        df_total,
-        how="outer",
-        on=["Date"],
-    )
+    return df_total.set_index("Date")
 
-    return herfindahl
+
+def _log_return_volatility(
+    price: np.ndarray, window: int = 30
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to calculate the log return and its rolling volatility
+    of a price array in one pass of numpy operations.
+    """
+
+    log_return = np.full(len(price), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_return[1:] = np.log(price[1:] / price[:-1])
+
+    # sample standard deviation of every full window, nan if any value is missing
+    volatility = np.full(len(price), np.nan)
+    if len(price) >= window:
+        volatility[window - 1 :] = np.lib.stride_tricks.sliding_window_view(
+            log_return, window
+        ).std(axis=1, ddof=1)
+
+    return log_return, volatility
 
 
 def _merge_sp(herfindahl: pd.DataFrame) -> pd.DataFrame:
@@ -315,14 +247,8 @@ def _merge_sp(herfindahl: pd.DataFrame) -> pd.DataFrame:
     Function to merge the crypto mraket index.
     """
 
-    # read in the csv file and ignore the first six rows
-    idx = pd.read_excel(
-        rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls",
-        index_col=None,
-        skiprows=6,
-        skipfooter=4,
-        usecols="A:B",
-    )
+    # read in the date and S&P columns, cached as parquet after the first read
+    idx = load_sp_index(rf"{GLOBAL_DATA_PATH}/token_market/PerformanceGraphExport.xls")
 
     # convert Effective date to datetime
     idx["Date"] = pd.to_datetime(idx["Date"])
@@ -341,8 +267,19 @@ def _merge_sp(herfindahl: pd.DataFrame) -> pd.DataFrame:
     # sort the dataframe by date
     herfindahl = herfindahl.sort_values(by="Date", ascending=True)
 
-    # interpolate the S&P column
-    herfindahl["price"] = herfindahl["S&P"].interpolate()
+    # linearly interpolate the S&P column over the positions of the
+    # missing values, keeping the missing values before the first price
+    # and leaving the column all missing if there is no price at all
+    sp_price = herfindahl["S&P"].to_numpy(dtype=float)
+    is_valid = ~np.isnan(sp_price)
+    if is_valid.any():
+        position = np.arange(len(sp_price))
+        sp_price = np.where(
+            position >= position[is_valid][0],
+            np.interp(position, position[is_valid], sp_price[is_valid]),
+            np.nan,
+        )
+    herfindahl["price"] = sp_price
 
     # # plot the S&P column
     # plt.plot(herfindahl["Date"], herfindahl["price"])
@@ -351,11 +288,10 @@ def _merge_sp(herfindahl: pd.DataFrame) -> pd.DataFrame:
     # plt.title("S&P")
     # plt.show()
 
-    # calculate the log return of the S&P column
-    herfindahl["S&P"] = np.log(herfindahl["price"] / herfindahl["price"].shift(1))
-
-    # calculate the 30-day rolling volatility of the S&P column
-    herfindahl["S&P_volatility"] = herfindahl["S&P"].rolling(30).std()
+    # calculate the log return and the 30-day rolling volatility of the S&P column
+    herfindahl["S&P"], herfindahl["S&P_volatility"] = _log_return_volatility(
+        sp_price, 30
+    )
 
     return herfindahl
 
@@ -380,14 +316,10 @@ def _merge_gas(herfindahl: pd.DataFrame) -> pd.DataFrame:
     # only keep columnes of "Date", "Gas_fee" and "ETH_price"
     gas = gas[["Date", "Gas_fee"]]
 
-    # calculate the log return of the gas price
-    gas["Gas_fee_log_return"] = np.log(gas["Gas_fee"] / gas["Gas_fee"].shift(1))
-
-    # calculate the 30-day rolling volatility for column "Gas_fee"
-    gas["Gas_fee_volatility"] = gas["Gas_fee_log_return"].rolling(30).std()
-
-    # drop the column "Gas_fee_log_return"
-    gas = gas.drop(columns=["Gas_fee_log_return"])
+    # calculate the 30-day rolling volatility of the log return of the gas price
+    _, gas["Gas_fee_volatility"] = _log_return_volatility(
+        gas["Gas_fee"].to_numpy(dtype=float), 30
+    )
 
     # merge the gas price using outer join
     herfindahl = pd.merge(
@@ -405,12 +337,19 @@ def generate_series_herfin() -> pd.DataFrame:
     Function to generate the series of herfindahl index.
     """
 
-    herfindahl = _merge_herfindahl_volume()
-    herfindahl = _merge_herfindahl_inflow_centrality(herfindahl)
-    herfindahl = _merge_herfindahl_outflow_centrality(herfindahl)
-    herfindahl = _merge_herfindahl_betweenness_centrality(herfindahl)
-    herfindahl = _merge_herfindahl_liquidity(herfindahl)
-    herfindahl = _merge_total_market_trading_volume(herfindahl)
+    # align the date-indexed series in a single outer join
+    herfindahl = (
+        pd.concat(
+            [
+                *[_merge_herfindahl(name) for name in HERFINDAHL_SOURCES],
+                _merge_total_market_trading_volume(),
+            ],
+            axis=1,
+            join="outer",
+        )
+        .sort_index()
+        .reset_index()
+    )
     herfindahl = _merge_sp(herfindahl)
     herfindahl = _merge_gas(herfindahl)
 
@@ -71,8 +71,8 @@ def _data_cleaning(token_data: pd.DataFrame) -> pd.DataFrame:
     token_data = token_data.loc[token_data["market_caps"] > 10**6]
 
     # winsorize the return by 1% and 99%
-    token_data["ret"] = token_data["ret"].clip(lower=token_data["ret"].quantile(0.01))
-    token_data["ret"] = token_data["ret"].clip(upper=token_data["ret"].quantile(0.99))
+    ret_lower, ret_upper = token_data["ret"].quantile([0.01, 0.99])
+    token_data["ret"] = token_data["ret"].clip(lower=ret_lower, upper=ret_upper)
 
     # calculate the market cap weighted market return
     mret = token_data.copy()
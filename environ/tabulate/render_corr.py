@@ -5,11 +5,13 @@ from pathlib import Path
 from typing import Literal, Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib import colors
 
-from environ.constants import FIGURE_PATH, PROCESSED_DATA_PATH
+from environ.constants import FIGURE_PATH
+from environ.utils.data_loader import load_panel_main
 from environ.utils.variable_constructer import (
     lag_variable_columns,
     map_variable_name_latex,
@@ -46,6 +48,47 @@ COLOR_DICT = {
 GnRd = colors.LinearSegmentedColormap("GnRd", COLOR_DICT)
 
 
+def _pairwise_corr_cov(
+    data: pd.DataFrame,
+    index: list[str],
+    columns: list[str],
+    fig_type: Literal["corr", "cov"] = "corr",
+) -> pd.DataFrame:
+    """
+    Function to compute the correlation or covariance between the index and
+    the columns only, using pairwise complete observations as pandas does.
+    """
+
+    # center each variable on its mean, which leaves the moments unchanged
+    # but keeps the sums below well conditioned
+    values = data.astype(float)
+    values = values - values.mean()
+
+    x, y = values[index].to_numpy(), values[columns].to_numpy()
+    x_obs, y_obs = ~np.isnan(x), ~np.isnan(y)
+    x, y = np.where(x_obs, x, 0), np.where(y_obs, y, 0)
+    x_obs, y_obs = x_obs.astype(float), y_obs.astype(float)
+
+    # sums over the observations where both variables of a pair are present
+    n_obs = x_obs.T @ y_obs
+    sum_x = x.T @ y_obs
+    sum_y = x_obs.T @ y
+    sum_xy = x.T @ y
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sxy = sum_xy - sum_x * sum_y / n_obs
+        if fig_type == "corr":
+            sxx = (x**2).T @ y_obs - sum_x**2 / n_obs
+            syy = x_obs.T @ y**2 - sum_y**2 / n_obs
+            block = np.clip(sxy / np.sqrt(sxx * syy), -1, 1)
+            block[n_obs < 1] = np.nan
+        else:
+            block = sxy / (n_obs - 1)
+            block[n_obs < 2] = np.nan
+
+    return pd.DataFrame(block, index=index, columns=columns)
+
+
 def render_corr_cov_tab(
     data: pd.DataFrame,
     sum_column: list[str] = [
@@ -69,43 +112,27 @@ def render_corr_cov_tab(
     """
 
     # whether auto lag is enabled
-    combi_column = sum_column + (
-        [
-            name_lag_variable(variable=col, lag=lag)
-            for col in sum_column
-            if col not in ["Stable", "is_boom"]
-        ]
-        if lag
-        else []
+    base_column = [col for col in sum_column if col not in ["Stable", "is_boom"]]
+    lag_column = (
+        [name_lag_variable(variable=col, lag=lag) for col in base_column] if lag else []
     )
+    combi_column = sum_column + lag_column
 
     # keep only the specified columns
     data = data[combi_column]
 
-    # create the correlation table
-    corr_cov_tab = data.corr() if fig_type == "corr" else data.cov()
-
-    # if lag is enabled, remove the lagged variables from the rows
-    # and remove the unlagged variables from the columns
-    corr_cov_tab = (
-        corr_cov_tab.drop(
-            [name_lag_variable(variable=col, lag=lag) for col in sum_column],
-            axis=0,
-        )
-        if lag
-        else corr_cov_tab
-    )
+    if not lag:
+        return data.corr() if fig_type == "corr" else data.cov()
 
-    corr_cov_tab = (
-        corr_cov_tab.drop(
-            [col for col in sum_column if col not in ["Stable", "is_boom"]], axis=1
-        )
-        if lag
-        else corr_cov_tab
+    # if lag is enabled, only compute the unlagged variables in the rows
+    # against the lagged variables in the columns
+    return _pairwise_corr_cov(
+        data=data,
+        index=sum_column,
+        columns=[col for col in combi_column if col not in base_column],
+        fig_type=fig_type,
     )
 
-    return corr_cov_tab
-
 
 def render_corr_cov_figure(
     corr_cov_tab: pd.DataFrame,
@@ -121,10 +148,9 @@ def render_corr_cov_figure(
         fig_type(str): The type of figure to be rendered.
     """
     # create a new dataframe with desired column names using map_variable_name_latex
-    corr_cov_tab = corr_cov_tab.copy()
-
-    corr_cov_tab.columns = corr_cov_tab.columns.map(map_variable_name_latex)
-    corr_cov_tab.index = corr_cov_tab.index.map(map_variable_name_latex)
+    corr_cov_tab = corr_cov_tab.rename(
+        index=map_variable_name_latex, columns=map_variable_name_latex
+    )
 
     # plot the correlation table
     hm = sns.heatmap(
@@ -152,10 +178,8 @@ def render_corr_cov_figure(
 
 
 if __name__ == "__main__":
-    # get the regressuib panel dataset from pickle file
-    regression_panel = pd.read_pickle(
-        PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-    )
+    # get the regressuib panel dataset
+    regression_panel = load_panel_main()
     # columns to be included in the correlation table
     corr_columns = [
         "Volume_share",
@@ -73,21 +73,22 @@ def panel_event_regression(
     ]
     all_added_dates = set(token_dates["Date"])
 
+    # treated tokens of each treated date
+    treated_token_dict = token_dates.groupby("Date")["Token"].apply(set).to_dict()
+
     diff_in_diff_df = diff_in_diff_df.loc[
         diff_in_diff_df["Token"].isin(
             diff_in_diff_df.loc[diff_in_diff_df["lead_lag"] >= 0]["Token"]
         )
     ]
 
-    did_reg_panel_full = pd.DataFrame()
+    did_reg_panel_lst = []
     for treated_date in all_added_dates:
         # obs_start_date should be 30 days before treated_dates
         obs_start_date = treated_date - window
         obs_end_date = treated_date + window
         # select treated tokens
-        treated_tokens = set(
-            token_dates.loc[(token_dates["Date"] == treated_date)]["Token"]
-        )
+        treated_tokens = treated_token_dict[treated_date]
         if (
             obs_start_date
             >= diff_in_diff_df.loc[diff_in_diff_df["Token"].isin(treated_tokens)][
@@ -131,9 +132,9 @@ def panel_event_regression(
                 # did_reg_panel["after_treated_date"] = (
                 #     did_reg_panel["Date"] >= treated_date
                 # ).astype(int)
-                did_reg_panel_full = pd.concat(
-                    [did_reg_panel_full, did_reg_panel], axis=0, ignore_index=True
-                )
+                did_reg_panel_lst.append(did_reg_panel)
+
+    did_reg_panel_full = pd.concat(did_reg_panel_lst, axis=0, ignore_index=True)
 
     # did_reg_panel_full["const"] = 1
     did_result = render_regress_table(
@@ -7,6 +7,66 @@ import pandas as pd
 logging.basicConfig(level=logging.INFO)
 
 
+def _first_index(condition, start: int, stop: int) -> int:
+    """
+    Return the first index in [start, stop) where the condition holds, or stop.
+    The condition is evaluated on doubling windows so that the work is
+    proportional to the distance to the first hit rather than to stop.
+    """
+
+    width = 64
+    while start < stop:
+        window_stop = min(start + width, stop)
+        hits = np.flatnonzero(condition(start, window_stop))
+        if len(hits) > 0:
+            return start + int(hits[0])
+        start = window_stop
+        width *= 2
+    return stop
+
+
+def _boom_bust_one_period_idx(
+    price: np.ndarray, boom_change: float, bust_change: float
+) -> tuple[str, int, int | None]:
+    """
+    Return the main trend, the end index and the pre-trend end index
+    of the period starting at the first price.
+    """
+
+    n = len(price)
+    boom_price = price[0] * (1 + boom_change)
+    bust_price = price[0] * (1 - bust_change)
+
+    first = _first_index(
+        lambda lo, hi: (price[lo:hi] > boom_price) | (price[lo:hi] < bust_price),
+        0,
+        n,
+    )
+
+    if first == n:
+        return "none", n - 1, None
+
+    cycle_end = first - 1
+    if price[first] > boom_price:
+        main_trend = "boom"
+        is_broken = lambda lo, hi: ~(price[lo + 1 : hi + 1] > price[lo:hi])
+    else:
+        main_trend = "bust"
+        is_broken = lambda lo, hi: ~(price[lo + 1 : hi + 1] < price[lo:hi])
+
+    # extend the period as long as the price keeps moving with the trend
+    cycle_end = _first_index(is_broken, cycle_end, n - 1)
+
+    # the extension moves strictly with the trend away from the price before the
+    # first crossing, so the extremum of the period lies before the crossing
+    price_array = price[:first]
+    pre_trend_end = int(
+        np.nanargmin(price_array) if main_trend == "boom" else np.nanargmax(price_array)
+    )
+
+    return main_trend, cycle_end, pre_trend_end
+
+
 def boom_bust_one_period(
     time_price: pd.DataFrame, boom_change: float = 0.3, bust_change: float = 0.3
 ) -> dict:
@@ -27,45 +87,15 @@ def boom_bust_one_period(
     if "price" not in time_price.columns or "time" not in time_price.columns:
         raise ValueError("Input DataFrame missing required columns.")
 
-    boom_threshold = time_price["price"][0] * (1 + boom_change)
-    bust_threshold = time_price["price"][0] * (1 - bust_change)
-
-    boom = np.where(time_price["price"] > boom_threshold)[0]
-    bust = np.where(time_price["price"] < bust_threshold)[0]
-
-    cycle = {
-        "main_trend": "none",
-        "start": time_price["time"].iloc[0],
-        "end": time_price["time"].iloc[-1],
-    }
-
-    if len(boom) == len(bust) == 0:
-        return cycle
-
-    if len(boom) == 0 or (len(bust) > 0 and bust[0] < boom[0]):
-        cycle["main_trend"] = "bust"
-        cycle_end = bust[0] - 1
-        while (
-            cycle_end + 1 < len(time_price["price"])
-            and time_price["price"][cycle_end + 1] < time_price["price"][cycle_end]
-        ):
-            cycle_end += 1
-    else:
-        cycle["main_trend"] = "boom"
-        cycle_end = boom[0] - 1
-        while (
-            cycle_end + 1 < len(time_price["price"])
-            and time_price["price"][cycle_end + 1] > time_price["price"][cycle_end]
-        ):
-            cycle_end += 1
-
-    cycle["end"] = time_price["time"][cycle_end]
+    time = time_price["time"].array
+    main_trend, cycle_end, pre_trend_end = _boom_bust_one_period_idx(
+        time_price["price"].to_numpy(dtype=float), boom_change, bust_change
+    )
 
-    price_array = time_price["price"].iloc[: cycle_end + 1]
+    cycle = {"main_trend": main_trend, "start": time[0], "end": time[cycle_end]}
 
-    cycle["pre_trend_end"] = time_price["time"][
-        price_array.idxmin() if cycle["main_trend"] == "boom" else price_array.idxmax()
-    ]
+    if pre_trend_end is not None:
+        cycle["pre_trend_end"] = time[pre_trend_end]
 
     return cycle
 
@@ -76,11 +106,18 @@ def boom_bust_periods(
     boom_bust_list = []
     # Sort the time_price dataframe by time
     time_price = time_price.sort_values(by="time").reset_index(drop=True)
-    end = time_price["time"][0]
+    time = time_price["time"].array
+    price = time_price["price"].to_numpy(dtype=float)
+    end = time[0]
+    start = 0
     previous_trend = "none"
-    while end < time_price["time"].iloc[-1]:
-        time_price = time_price[time_price["time"] >= end].reset_index(drop=True)
-        cycle_dict = boom_bust_one_period(time_price, boom_change, bust_change)
+    while end < time[-1]:
+        main_trend, cycle_end, pre_trend_end = _boom_bust_one_period_idx(
+            price[start:], boom_change, bust_change
+        )
+        cycle_dict = {"main_trend": main_trend, "end": time[start + cycle_end]}
+        if pre_trend_end is not None:
+            cycle_dict["pre_trend_end"] = time[start + pre_trend_end]
         if cycle_dict["main_trend"] != "none" and previous_trend != "none":
             if cycle_dict["main_trend"] == previous_trend:
                 boom_bust_list[-1]["end"] = cycle_dict["end"]
@@ -110,6 +147,11 @@ def boom_bust_periods(
                     "end": cycle_dict["end"],
                 }
             )
+        # advance to the first time not before the end of the period, which
+        # only differs from the end index if the time has duplicates
+        start += int(
+            time[start : start + cycle_end + 1].searchsorted(cycle_dict["end"])
+        )
         end = cycle_dict["end"]
         previous_trend = cycle_dict["main_trend"]
     return boom_bust_list
@@ -3,9 +3,50 @@ Util to merge data from different sources
 """
 
 import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from environ.constants import PROCESSED_DATA_PATH
+
+# known column types of the dated csv files to skip type inference
+DATED_CSV_TYPES = {
+    "Token": pa.string(),
+    "token": pa.string(),
+    "node": pa.string(),
+    "Volume": pa.float64(),
+    "total_tvl": pa.float64(),
+    "eigenvector_centrality": pa.float64(),
+    "betweenness_centrality_count": pa.float64(),
+    "betweenness_centrality_volume": pa.float64(),
+}
+
+
+def parse_file_dates(all_files: list[str]) -> pd.DatetimeIndex:
+    """
+    Function to parse the "yyyymmdd" date at the end of each file name
+    with one vectorized regex and one datetime conversion
+
+    Args:
+        all_files (list[str]): Paths or names of the csv files
+
+    Returns:
+        pd.DatetimeIndex: Date of each file
+    """
+
+    return pd.DatetimeIndex(
+        pd.to_datetime(
+            pd.Series(all_files, dtype=object).str.extract(
+                r"_(\d{8})\.csv$", expand=False
+            ),
+            format="%Y%m%d",
+        )
+    )
 
 
 def load_data(
@@ -28,12 +69,158 @@ def load_data(
         pd.DataFrame: Merged dataframe
     """
 
-    df_merged = pd.DataFrame()
-    for file_name in glob.glob("*.csv", root_dir=data_path):
+    file_names = glob.glob("*.csv", root_dir=data_path)
+
+    df_data_lst = []
+    for file_name, date in zip(file_names, parse_file_dates(file_names)):
         df_data = pd.read_csv(f"{str(data_path)}/{file_name}")
-        df_data["Date"] = pd.to_datetime(file_name.split("_")[-1].split(".")[0])
-        df_merged = pd.concat([df_merged, df_data])
+        df_data["Date"] = date
+        df_data_lst.append(df_data)
+
+    # concatenate once rather than growing the frame in the loop
+    df_merged = pd.concat(df_data_lst)
 
     df_merged.rename(columns=rename_dict, inplace=True)
 
     return panel_main.merge(df_merged[data_col], **kwargs)
+
+
+def read_csvs(
+    all_files: list[str],
+    column_types: dict[str, pa.DataType] | None = None,
+    columns: list[str] | None = None,
+) -> list[pa.Table]:
+    """
+    Function to parse the csv files into pyarrow tables in threads
+
+    Args:
+        all_files (list[str]): Paths to the csv files
+        column_types (dict[str, pa.DataType]): Known column types
+        columns (list[str]): Columns to parse, all columns by default
+
+    Returns:
+        list[pa.Table]: One table per csv file
+    """
+
+    convert_options = pv.ConvertOptions(
+        column_types=column_types, include_columns=columns
+    )
+
+    # parse the files in threads as pyarrow releases the gil while parsing
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(
+            executor.map(
+                partial(pv.read_csv, convert_options=convert_options), all_files
+            )
+        )
+
+
+def load_dated_csvs(
+    all_files: list[str],
+    column_types: dict[str, pa.DataType] | None = None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Function to load in the csv files with a "yyyymmdd" date at the end of
+    the file name into one dataframe, parsing with pyarrow in threads
+
+    Args:
+        all_files (list[str]): Paths to the csv files
+        column_types (dict[str, pa.DataType]): Known column types,
+            DATED_CSV_TYPES by default
+        columns (list[str]): Columns to parse, all columns by default
+
+    Returns:
+        pd.DataFrame: Combined dataframe with the Date of each file
+    """
+
+    tables = read_csvs(
+        all_files,
+        column_types=DATED_CSV_TYPES if column_types is None else column_types,
+        columns=columns,
+    )
+    table = pa.concat_tables(tables, promote_options="permissive")
+
+    # skip the unnamed row number column of each csv file before conversion
+    frame = table.select([name for name in table.column_names if name]).to_pandas()
+
+    # parse the date of each file once and repeat it for the rows of the file
+    frame["Date"] = parse_file_dates(all_files).repeat(
+        [file_table.num_rows for file_table in tables]
+    )
+
+    return frame
+
+
+def load_sp_index(xls_path: str | Path) -> pd.DataFrame:
+    """
+    Function to load in the date and S&P columns of the S&P index export,
+    caching them as a parquet file next to the xls file
+
+    Args:
+        xls_path (str): Path to the PerformanceGraphExport.xls file
+
+    Returns:
+        pd.DataFrame: Dataframe with the Date and S&P columns
+    """
+
+    xls_path = Path(xls_path)
+    parquet_path = xls_path.with_suffix(".parquet")
+
+    # reuse the parquet file unless the xls file has been updated since
+    if (
+        parquet_path.exists()
+        and parquet_path.stat().st_mtime >= xls_path.stat().st_mtime
+    ):
+        return pd.read_parquet(parquet_path)
+
+    # read in the xls file and ignore the first six rows
+    idx = pd.read_excel(
+        xls_path,
+        index_col=None,
+        skiprows=6,
+        skipfooter=4,
+        usecols="A:B",
+    )
+    idx.to_parquet(parquet_path, index=False)
+
+    return idx
+
+
+def load_panel_main(columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Function to load in the main token-date panel, memory mapping the
+    uncompressed feather file if it is at least as new as the zip pickle,
+    otherwise decompressing the zip pickle
+
+    Args:
+        columns (list[str] | None): Columns to load, all columns if None
+
+    Returns:
+        pd.DataFrame: The main token-date panel
+    """
+
+    feather_path = PROCESSED_DATA_PATH / "panel_main.feather"
+    pickle_path = PROCESSED_DATA_PATH / "panel_main.pickle.zip"
+
+    # the pickle may be rewritten on its own, in which case the feather is stale
+    if not feather_path.exists() or (
+        pickle_path.exists()
+        and pickle_path.stat().st_mtime > feather_path.stat().st_mtime
+    ):
+        panel_main = pd.read_pickle(pickle_path, compression="zip")
+        return panel_main if columns is None else panel_main[columns]
+
+    # the columns are read straight from the mapped file without decompression
+    # and copied once into writable blocks, as the scripts modify the panel
+    with pa.memory_map(str(feather_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            # keep the stored index along with the selected columns
+            index_columns = [
+                column
+                for column in table.schema.pandas_metadata["index_columns"]
+                if isinstance(column, str)
+            ]
+            table = table.select(columns + index_columns)
+        return table.to_pandas()
@@ -2,6 +2,7 @@
 This module contains functions to construct variables in preparation for regression.
 """
 
+from functools import lru_cache
 from typing import Any, Callable, Iterable
 
 import numpy as np
@@ -10,6 +11,7 @@ import pandas as pd
 from environ.constants import ALL_NAMING_DICT
 
 
+@lru_cache(maxsize=None)
 def name_lag_variable(variable: str, lag: int = 1) -> str:
     """
     name the lag variable
@@ -17,6 +19,7 @@ def name_lag_variable(variable: str, lag: int = 1) -> str:
     return f"{variable}_lag_{lag}"
 
 
+@lru_cache(maxsize=None)
 def name_interaction_variable(variable1: str, variable2: str) -> str:
     """
     name the interaction variable
@@ -61,6 +64,7 @@ def name_share_variable(variable: str) -> str:
     return f"{variable}_share"
 
 
+@lru_cache(maxsize=None)
 def map_variable_name_latex(variable: str) -> str:
     """
     Map the variable name to its corresponding LaTeX representation.
@@ -148,26 +152,82 @@ def diff_variable_columns(
     )
 
 
+def _lag_source_index(
+    data: pd.DataFrame, entity_variable: str | None, lags: list[int]
+) -> dict[int, np.ndarray]:
+    """
+    Find the position of the row lag periods earlier within the same entity
+    for each lag, following the order of the rows as groupby(entity).shift does.
+    """
+
+    n_rows = len(data)
+
+    if entity_variable:
+        # rows with a missing entity belong to no group and are never lagged
+        codes, _ = pd.factorize(data[entity_variable])
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+    else:
+        order = np.arange(n_rows)
+        sorted_codes = np.zeros(n_rows, dtype=np.intp)
+
+    sources = {}
+    for lag in lags:
+        # in the rows sorted by entity, the source is lag rows earlier in the block
+        position = np.arange(n_rows) - lag
+        in_range = (position >= 0) & (position < n_rows)
+        position = np.clip(position, 0, max(n_rows - 1, 0))
+        is_valid = (
+            in_range & (sorted_codes[position] == sorted_codes) & (sorted_codes >= 0)
+        )
+
+        source = np.full(n_rows, -1, dtype=np.intp)
+        source[order] = np.where(is_valid, order[position], -1)
+        sources[lag] = source
+
+    return sources
+
+
 def lag_variable_columns(
     data: pd.DataFrame,
     variable: str | Iterable[str],
     time_variable: str = "Date",
     entity_variable: str | None = None,
-    lag: int = 1,
+    lag: int | Iterable[int] = 1,
 ) -> pd.DataFrame:
     """
-    Lag the variable by lag periods.
+    Lag the variable by lag periods, or by each of the lags if several are given.
     """
 
-    return column_manipulator(
-        data=data,
-        variable=variable,
-        summary_func=lambda x: x.shift(lag),
-        new_col_name_func=lambda x: name_lag_variable(x, lag=lag),
-        time_variable=time_variable,
-        group_variable=entity_variable,
+    data = data.sort_values(by=time_variable)
+
+    if isinstance(variable, str):
+        variable = [variable]
+
+    # position of the row lag periods earlier in the same entity, or -1 if none
+    sources = _lag_source_index(
+        data, entity_variable, [lag] if isinstance(lag, int) else list(lag)
     )
 
+    # float columns are lagged together as one two-dimensional block
+    float_var = [var for var in variable if data[var].dtype == np.float64]
+    float_block = data[float_var].to_numpy(dtype=np.float64)
+
+    lagged = {}
+    for lag_value, source in sources.items():
+        lagged_block = float_block[source]
+        lagged_block[source < 0] = np.nan
+        lagged_float = dict(zip(float_var, lagged_block.T))
+
+        for var in variable:
+            lagged[name_lag_variable(var, lag=lag_value)] = (
+                lagged_float[var]
+                if var in lagged_float
+                else pd.api.extensions.take(data[var].array, source, allow_fill=True)
+            )
+
+    return data.assign(**lagged)
+
 
 def share_variable_columns(
     data: pd.DataFrame,
@@ -0,0 +1,8 @@
+"""
+Script to convert the dated csv files of the panel into parquet datasets.
+"""
+
+from environ.tabulate.panel.panel_generator import DATED_SOURCES, write_dated_dataset
+
+for name in DATED_SOURCES:
+    write_dated_dataset(name)
@@ -1,8 +1,13 @@
-# get the regression panel dataset from pickled file
+# get the regression panel dataset
+
+from itertools import chain
+import re
 
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.lines import Line2D
 
 from environ.constants import (
     AAVE_DEPLOYMENT_DATE,
@@ -10,12 +15,12 @@ from environ.constants import (
     COMPOUND_DEPLOYMENT_DATE,
     DEPENDENT_VARIABLES,
     FIGURE_PATH,
-    PROCESSED_DATA_PATH,
     SAMPLE_PERIOD,
     TABLE_PATH,
 )
 from environ.tabulate.render_panel_event_regression import panel_event_regression
 from environ.tabulate.render_regression import render_regress_table_latex
+from environ.utils.data_loader import load_panel_main
 from environ.utils.variable_constructer import (
     name_interaction_variable,
     return_vol,
@@ -46,9 +51,7 @@ plf_date = pd.DataFrame(
 )
 
 
-reg_panel = pd.read_pickle(
-    PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-)
+reg_panel = load_panel_main()
 # restrict to SAMPE_PERIOD
 reg_panel = reg_panel[
     (reg_panel["Date"] >= SAMPLE_PERIOD[0]) & (reg_panel["Date"] <= SAMPLE_PERIOD[1])
@@ -64,16 +67,6 @@ reg_panel = return_vol(
     rolling_window_vol=rolling_window_vol,
 )
 reg_panel["Date"] = reg_panel["Date"].astype(int) // (10**9 * INTERVAL_IN_SECONDS)
-# average by Date and Token
-reg_panel = reg_panel.groupby(["Date", "Token"]).mean(numeric_only=True).reset_index()
-
-reg_panel = reg_panel.merge(plf_date, on="Token", how="left")
-
-
-RELTIME_DUMMY = "rel_time"
-FACTOR_PREFIX = "_"
-
-all_added_dates = set(plf_date["join_time_list"].sum())
 
 indvs = [
     "mcap_share",
@@ -86,22 +79,34 @@ indvs = [
 dvs = DEPENDENT_VARIABLES + [
     # name_log_return_vol_variable(variable, rolling_window_return, rolling_window_vol)
 ]
-diff_in_diff_df = reg_panel.loc[:, ["Token", "Date"] + dvs + indvs]
 
+# average by Date and Token, only over the variables used in the regression,
+# grouping on the codes of the categorical Token instead of hashing strings
+reg_panel = (
+    reg_panel[["Date", "Token"] + dvs + indvs]
+    .astype({"Token": "category"})
+    .groupby(["Date", "Token"], observed=True)
+    .mean(numeric_only=True)
+    .reset_index()
+)
 
-def lead_lag(date: float, join_time_list: list[float]) -> float:
-    # if join_time_list is not NaN
-    if join_time_list is not np.nan:
-        return date - min(join_time_list, key=lambda d: abs(d - date))
-    else:
-        return np.nan
+# merging on the string Token of plf_date turns Token back into strings
+reg_panel = reg_panel.merge(plf_date, on="Token", how="left")
 
 
-# lead_lag is the time difference between the date of the observation and the date of the nearest treatment from join_time_list
-diff_in_diff_df["lead_lag"] = reg_panel.apply(
-    lambda row: lead_lag(row["Date"], row["join_time_list"]), axis=1
-)
+RELTIME_DUMMY = "rel_time"
+FACTOR_PREFIX = "_"
+
+# cells of the regression table look like "$beta^{***}$ \\ ($se$)"
+COEF_PATTERN = re.compile(r"[$^]([^$^]*)")
+SE_PATTERN = re.compile(r"\(\$(.*?)\$\)")
+
+all_added_dates = set(chain.from_iterable(plf_date["join_time_list"]))
+
+diff_in_diff_df = reg_panel.loc[:, ["Token", "Date"] + dvs + indvs]
+
 
+# lead_lag is the time difference between the date of the observation and the date of the earliest treatment
 diff_in_diff_df["lead_lag"] = reg_panel["Date"] - reg_panel["earliest_join_time"]
 
 diff_in_diff_df["has_been_treated"] = diff_in_diff_df["lead_lag"] >= 0
@@ -144,36 +149,62 @@ for lead_lag_interval in [None, 7]:
         plot_df = did_result.loc[
             did_result.index.intersection(list(time_to_treat_cols)), :
         ]
-        plot_df["time_to_join"] = plot_df.index.map(lambda x: int(x.split("_")[-1]))
+        # the time to join is the number after the last "_" of the dummy name
+        plot_df["time_to_join"] = plot_df.index.str.rsplit("_", n=1).str[-1].astype(int)
         # sort by time_to_join
         plot_df = plot_df.sort_values(by="time_to_join")
 
         # get the number for each cell, where the string separates can be either $ or ^, and take the first one
         plot_df_co = (
             plot_df[did_result.columns]
-            .apply(lambda x: x.str.split(r"[$^]").str[1])
+            .apply(lambda x: x.str.extract(COEF_PATTERN, expand=False))
             .astype(float)
         )
 
         plot_df_se = (
             plot_df[did_result.columns]
-            .applymap(lambda x: float(x.split("($")[1].split("$)")[0]))
+            .apply(lambda x: x.str.extract(SE_PATTERN, expand=False))
             .astype(float)
         )
 
-        x = plot_df["time_to_join"]
-        # plot the result
-        for k, v in did_result.loc["regressand"].items():
-            plt.plot(x, plot_df_co[k], label=f"{'$'+ALL_NAMING_DICT[v]+'$' if v in ALL_NAMING_DICT else v}")  # type: ignore
-
-            # plot the standard error band
-            plt.fill_between(
-                x,
-                plot_df_co[k] - 1.96 * plot_df_se[k],  # type: ignore
-                plot_df_co[k] + 1.96 * plot_df_se[k],  # type: ignore
+        x = plot_df["time_to_join"].to_numpy()
+        regressands = did_result.loc["regressand"]
+        coef = plot_df_co[regressands.index].to_numpy().T
+        band = 1.96 * plot_df_se[regressands.index].to_numpy().T
+        # one color of the default cycle per regressand, as successive plots get
+        line_colors = [f"C{i}" for i in range(len(regressands))]
+
+        # plot the result and the standard error bands as one collection each
+        ax = plt.gca()
+        ax.add_collection(
+            LineCollection([np.column_stack([x, y]) for y in coef], colors=line_colors)
+        )
+        ax.add_collection(
+            PolyCollection(
+                [
+                    np.vstack(
+                        [
+                            np.column_stack([x, y - b]),
+                            np.column_stack([x, y + b])[::-1],
+                        ]
+                    )
+                    for y, b in zip(coef, band)
+                ],
+                facecolors=line_colors,
+                edgecolors="none",
                 alpha=0.2,
             )
-        plt.legend(bbox_to_anchor=(1.05, 1), loc="upper left", borderaxespad=0.0)
+        )
+        ax.autoscale_view()
+        plt.legend(
+            handles=[
+                Line2D([], [], color=color, label=f"{'$'+ALL_NAMING_DICT[v]+'$' if v in ALL_NAMING_DICT else v}")  # type: ignore
+                for color, v in zip(line_colors, regressands)
+            ],
+            bbox_to_anchor=(1.05, 1),
+            loc="upper left",
+            borderaxespad=0.0,
+        )
 
         # plot verticle line at 0
         plt.axvline(x=0, color="black", linestyle="--")
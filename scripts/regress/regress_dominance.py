@@ -1,10 +1,7 @@
-# get the regression panel dataset from pickled file
-import pandas as pd
-
+# get the regression panel dataset
 from environ.constants import (
     DEPENDENT_VARIABLES,
     SAMPLE_PERIOD,
-    PROCESSED_DATA_PATH,
     TABLE_PATH,
 )
 from environ.tabulate.render_regression import (
@@ -12,15 +9,14 @@ from environ.tabulate.render_regression import (
     render_regress_table,
     render_regress_table_latex,
 )
+from environ.utils.data_loader import load_panel_main
 from environ.utils.variable_constructer import (
     lag_variable_columns,
     name_interaction_variable,
     name_lag_variable,
 )
 
-reg_panel = pd.read_pickle(
-    PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-)
+reg_panel = load_panel_main()
 reg_panel[DEPENDENT_VARIABLES].isna().sum()
 
 
@@ -1,18 +1,15 @@
-# get the regression panel dataset from pickled file
+# get the regression panel dataset
 
-import pandas as pd
-
-from environ.constants import TABLE_PATH, PROCESSED_DATA_PATH
+from environ.constants import TABLE_PATH
 from environ.tabulate.render_regression import (
     construct_regress_vars,
     render_regress_table,
     render_regress_table_latex,
 )
+from environ.utils.data_loader import load_panel_main
 
 
-reg_panel = pd.read_pickle(
-    PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-)
+reg_panel = load_panel_main()
 
 
 dependent_variables = [
@@ -1,23 +1,20 @@
-# get the regression panel dataset from pickled file
+# get the regression panel dataset
 from itertools import product
 
-import pandas as pd
-
-from environ.constants import PROCESSED_DATA_PATH, TABLE_PATH
+from environ.constants import TABLE_PATH
 from environ.tabulate.render_regression import (
     construct_regress_vars,
     render_regress_table,
     render_regress_table_latex,
 )
+from environ.utils.data_loader import load_panel_main
 from environ.utils.variable_constructer import (
     diff_variable_columns,
     lag_variable_columns,
     name_lag_variable,
 )
 
-reg_panel = pd.read_pickle(
-    PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
-)
+reg_panel = load_panel_main()
 
 betw_cents = [
     "betweenness_centrality_volume",
@@ -40,15 +37,14 @@ reg_panel = diff_variable_columns(
 
 total_lag = 1
 lag_range = range(1, total_lag + 1)
-for lag in lag_range:
-    reg_panel = lag_variable_columns(
-        reg_panel,
-        # [name_diff_variable(v, lag=1) for v in all_dev],
-        all_dev,
-        time_variable="Date",
-        entity_variable="Token",
-        lag=lag,
-    )
+reg_panel = lag_variable_columns(
+    reg_panel,
+    # [name_diff_variable(v, lag=1) for v in all_dev],
+    all_dev,
+    time_variable="Date",
+    entity_variable="Token",
+    lag=lag_range,
+)
 
 reg_combi = []
 for b in betw_cents:
@@ -2,45 +2,104 @@
 Script to render the asset pricing table
 """
 
+import multiprocessing as mp
+
 import pandas as pd
+from tqdm import tqdm
 
 from environ.constants import (
     DEPENDENT_VARIABLES,
-    PROCESSED_DATA_PATH,
     STABLE_DICT,
     TABLE_PATH,
 )
-from environ.process.asset_pricing.double_sorting import asset_pricing
-
-# load the regression panel dataset
-reg_panel = pd.read_pickle(
-    PROCESSED_DATA_PATH / "panel_main.pickle.zip", compression="zip"
+from environ.process.asset_pricing.double_sorting import (
+    calculate_period_return,
+    portfolio_pricing,
 )
+from environ.utils.data_loader import load_panel_main
+
+FREQUENCY_LIST = [14, 30]
+
+# period return panels shared with the workers, keyed by (panel_info, frequency)
+period_panel_dict: dict[tuple[str, int], pd.DataFrame] = {}
+
+
+def _init_worker(period_panels: dict[tuple[str, int], pd.DataFrame]) -> None:
+    """
+    Function to pass the period return panels to each worker once
+    """
+
+    period_panel_dict.update(period_panels)
+
+
+def _tabulate_asset_pricing(task: tuple[str, int, str]) -> None:
+    """
+    Function to render the asset pricing table of one panel, frequency and dominance
+    """
+
+    panel_info, frequency, dominance = task
+
+    df_ap = (
+        portfolio_pricing(
+            period_panel_dict[(panel_info, frequency)],
+            [0.8],
+            dominance,
+            frequency,
+            False,
+        )
+        .set_index("Portfolios")
+        .T
+    )
+
+    # save the results in latex keep the index and keep three decimal places
+    df_ap.to_latex(
+        TABLE_PATH / f"asset_pricing_{panel_info}_{dominance}_{frequency}.tex",
+        index=True,
+        escape=False,
+        float_format="{:0.4f}".format,
+    )
+
+
+if __name__ == "__main__":
+    # load the columns of the regression panel dataset used in asset pricing
+    reg_panel = load_panel_main(
+        columns=["Token", "Date", "supply_rates", "dollar_exchange_rate", "mcap"]
+        + DEPENDENT_VARIABLES,
+    )
+
+    reg_panel["daily_supply_return"] = reg_panel["supply_rates"] / 365.2425
+
+    # stable non-stable info dict
+    is_stable = reg_panel["Token"].isin(STABLE_DICT.keys())
+    stable_nonstable_info = {
+        "stablecoin": reg_panel[is_stable],
+        "non-stablecoin": reg_panel[~is_stable],
+        "all": reg_panel,
+    }
+
+    # the period return panel only depends on the panel and the frequency
+    period_panels = {
+        (panel_info, frequency): calculate_period_return(
+            df_panel=df_panel, freq=frequency
+        )
+        for panel_info, df_panel in stable_nonstable_info.items()
+        for frequency in FREQUENCY_LIST
+    }
+
+    task_lst = [
+        (panel_info, frequency, dominance)
+        for panel_info, frequency in period_panels
+        for dominance in DEPENDENT_VARIABLES + ["ret"]
+    ]
 
-reg_panel["daily_supply_return"] = reg_panel["supply_rates"] / 365.2425
-
-# stable non-stable info dict
-stable_nonstable_info = {
-    "stablecoin": reg_panel[reg_panel["Token"].isin(STABLE_DICT.keys())],
-    "non-stablecoin": reg_panel[~reg_panel["Token"].isin(STABLE_DICT.keys())],
-    "all": reg_panel,
-}
-
-for panel_info, df_panel in stable_nonstable_info.items():
-    for dominance in DEPENDENT_VARIABLES + ["ret"]:
-        for frequency in [14, 30]:
-            print(f"Processing {panel_info} {dominance} {frequency}")
-
-            df_ap = (
-                asset_pricing(df_panel, [0.8], dominance, frequency, False)
-                .set_index("Portfolios")
-                .T
-            )
-
-            # save the results in latex keep the index and keep three decimal places
-            df_ap.to_latex(
-                TABLE_PATH / f"asset_pricing_{panel_info}_{dominance}_{frequency}.tex",
-                index=True,
-                escape=False,
-                float_format="{:0.4f}".format,
-            )
+    # render the tables in parallel
+    with mp.Pool(
+        processes=mp.cpu_count(),
+        initializer=_init_worker,
+        initargs=(period_panels,),
+    ) as pool:
+        for _ in tqdm(
+            pool.imap_unordered(_tabulate_asset_pricing, task_lst),
+            total=len(task_lst),
+        ):
+            pass
@@ -7,6 +7,7 @@ setup(
         "numpy",
         "pandas == 2.0.0",
         "scipy",
+        "pyarrow >= 14",
         "requests",
         "matplotlib",
         "web3",